@@ -0,0 +1,93 @@
+"""
+Measures the startup time of the CLI with `python -X importtime`.
+
+Example:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --top 15
+
+Every scenario is run several times in a fresh interpreter. The wall time
+covers the whole process, the import time is the sum of the cumulative
+times of all top level imports as reported by the interpreter. The
+slowest modules of the last run are listed to spot new eager imports.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+SCENARIOS = {
+    "interpreter": ["-c", "pass"],
+    "--version": ["-m", "aniworld", "--version"],
+    "--help": ["-m", "aniworld", "--help"],
+    "-lf (local files)": ["-m", "aniworld", "-lf", os.devnull, "-a", "Watch", "-C"]
+}
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, int, str]]:
+    # import time: self [us] | cumulative | imported package
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(self_time), int(cumulative), name[1:].rstrip()))
+    return modules
+
+
+def run_scenario(arguments: list, runs: int, env: dict) -> tuple[list, list, list]:
+    wall_times = []
+    import_times = []
+    modules = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *arguments],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=False
+        )
+        wall_times.append((time.perf_counter() - start) * 1000)
+
+        modules = parse_importtime(result.stderr)
+        top_level = [cumulative for _, cumulative, name in modules if not name.startswith(" ")]
+        import_times.append(sum(top_level) / 1000)
+
+    return wall_times, import_times, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup benchmark for aniworld.")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per scenario.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list.")
+    args = parser.parse_args()
+
+    source_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [source_directory, os.environ.get("PYTHONPATH")])
+        )
+    }
+
+    for scenario, arguments in SCENARIOS.items():
+        wall_times, import_times, modules = run_scenario(arguments, args.runs, env)
+        print(
+            f"{scenario:<20} wall {statistics.median(wall_times):7.1f} ms "
+            f"(min {min(wall_times):.1f}), "
+            f"imports {statistics.median(import_times):7.1f} ms"
+        )
+
+        if scenario == "interpreter":
+            continue
+
+        for self_time, cumulative, name in sorted(modules, key=lambda m: -m[1])[:args.top]:
+            print(f"    {cumulative / 1000:7.1f} ms {self_time / 1000:7.1f} ms  {name.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,11 @@ import ctypes
 import platform
 
 from aniworld.entry import aniworld
-from aniworld.config import VERSION
 
 
 def main():
     if platform.system() == "Windows":
+        from aniworld.config import VERSION  # pylint: disable=import-outside-toplevel
         ctypes.windll.kernel32.SetConsoleTitleW(
             f"AniWorld-Downloader {VERSION}"
         )
@@ -1,3 +1,8 @@
-from .download import download
-from .syncplay import syncplay
-from .watch import watch
+# the submodules are named like their actions, bind the functions eagerly so
+# importing e.g. aniworld.action.watch doesn't shadow watch(); none of them
+# loads the models on import
+from aniworld.action.download import download, download_episode
+from aniworld.action.syncplay import syncplay
+from aniworld.action.watch import watch
+
+__all__ = ["download", "download_episode", "syncplay", "watch"]
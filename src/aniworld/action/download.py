@@ -2,78 +2,282 @@ import os
 import re
 import subprocess
 import logging
+import concurrent.futures
+from typing import TYPE_CHECKING
 
-from aniworld.models import Anime
-from aniworld.config import PROVIDER_HEADERS, INVALID_PATH_CHARS
-from aniworld.parser import arguments
+from aniworld.config import (
+    PROVIDER_HEADERS,
+    INVALID_PATH_CHARS,
+    DEFAULT_PREFLIGHT_MARGIN,
+    DEFAULT_PREFLIGHT_WORKERS
+)
+from aniworld.common import (
+    open_event_stream,
+    get_message_stream,
+    run_with_progress_events,
+    get_free_space,
+    format_size,
+    SpaceReservation
+)
+from aniworld.settings import get_settings
 
+if TYPE_CHECKING:
+    from aniworld.models import Anime, Episode
 
-def download(anime: Anime):
-    for episode in anime:
-        if arguments.only_direct_link:
-            msg = f"{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-            print(msg)
-            print(f"{episode.get_direct_link()}\n")
-            continue
 
-        sanitized_anime_title = ''.join(
-            char for char in anime.title if char not in INVALID_PATH_CHARS
+def download(anime: "Anime"):
+    settings = get_settings()
+    if settings.preflight and not (settings.only_direct_link or settings.only_command):
+        download_with_preflight(anime)
+    else:
+        for episode in anime:
+            download_episode(anime, episode)
+
+    if verifies_downloads():
+        # pylint: disable=import-outside-toplevel
+        from aniworld.common import wait_for_verifications
+        wait_for_verifications()
+
+
+def estimate_episode_size(anime: "Anime", episode: "Episode") -> int or None:
+    try:
+        # kept on episode.direct_link, download_episode() reuses it while it's fresh
+        direct_link = episode.get_direct_link()
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Could not resolve S%sE%s: %s", episode.season, episode.episode, e)
+        return None
+    # the stream probe loads requests, local playback imports this module too
+    from aniworld.common import get_stream_info  # pylint: disable=import-outside-toplevel
+    return get_stream_info(direct_link, PROVIDER_HEADERS.get(anime.provider))["size"]
+
+
+def download_with_preflight(anime: "Anime") -> None:
+    """
+    Estimates the size of every episode (Content-Length or HLS bandwidth
+    times duration) before the first transfer starts and compares the total
+    with the free space of the output directory. Depending on --preflight
+    the batch is refused or trimmed to the episodes that fit.
+    """
+
+    settings = get_settings()
+    if settings.progress_events:
+        # before the first message, which must not end up between the events
+        open_event_stream(settings.progress_events)
+
+    episodes = list(anime)
+    print(f"Estimating the size of {len(episodes)} episode(s)...", file=get_message_stream())
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=DEFAULT_PREFLIGHT_WORKERS) as executor:
+        sizes = list(executor.map(
+            lambda episode: estimate_episode_size(anime, episode), episodes))
+
+    known_sizes = [size for size in sizes if size]
+    if not known_sizes:
+        logging.warning("No episode size could be estimated, skipping preflight.")
+        for episode in episodes:
+            download_episode(anime, episode)
+        return
+
+    # episodes without a size are assumed to be as large as the average
+    average_size = sum(known_sizes) // len(known_sizes)
+    sizes = [size or average_size for size in sizes]
+
+    output_directory = os.path.dirname(get_output_path(anime, episodes[0]))
+    available = get_free_space(output_directory) - DEFAULT_PREFLIGHT_MARGIN
+    required = sum(sizes)
+    logging.debug("Preflight: %d bytes required, %d available", required, available)
+
+    if required > available:
+        fitting = 0
+        while fitting < len(sizes) and sum(sizes[:fitting + 1]) <= available:
+            fitting += 1
+
+        if settings.preflight == "refuse" or not fitting:
+            print(
+                f"Not enough disk space: {format_size(required)} required, "
+                f"{format_size(max(available, 0))} available in {output_directory}.",
+                file=get_message_stream()
+            )
+            return
+
+        print(
+            f"Not enough disk space for all episodes, downloading the first {fitting} "
+            f"of {len(episodes)} ({format_size(sum(sizes[:fitting]))}).",
+            file=get_message_stream()
         )
-        output_file = (
-            f"{sanitized_anime_title} - "
-            f"S{episode.season}E{episode.episode} - "
-            f"({anime.language}).mp4"
+        episodes, sizes = episodes[:fitting], sizes[:fitting]
+
+    reservation = SpaceReservation(output_directory, sum(sizes))
+    try:
+        for index, episode in enumerate(episodes):
+            # hand this episode's share of the reserved space back to yt-dlp
+            reservation.shrink(sum(sizes[index + 1:]))
+            download_episode(anime, episode)
+    finally:
+        reservation.release()
+
+
+def get_output_path(anime: "Anime", episode: "Episode") -> str:
+    sanitized_anime_title = ''.join(
+        char for char in anime.title if char not in INVALID_PATH_CHARS
+    )
+    output_file = (
+        f"{sanitized_anime_title} - "
+        f"S{episode.season}E{episode.episode} - "
+        f"({anime.language}).mp4"
+    )
+    return os.path.join(
+        anime.output_directory, sanitized_anime_title, output_file
+    )
+
+
+def requeue_download(
+    anime: "Anime",
+    episode: "Episode",
+    output_path: str,
+    error: str,
+    job_id: int = None
+) -> None:
+    # imported here as the queue itself depends on this module
+    from aniworld.jobqueue import requeue_job  # pylint: disable=import-outside-toplevel
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    job_id = requeue_job(
+        episode.link, anime.language, anime.provider, anime.output_directory, error, job_id
+    )
+    if job_id:
+        print(
+            f"Re-queued {output_path} as job {job_id}, run 'aniworld queue worker'.",
+            file=get_message_stream()
         )
-        output_path = os.path.join(
-            arguments.output_dir, sanitized_anime_title, output_file
+    else:
+        print(f"Giving up on {output_path} after repeated failures.", file=get_message_stream())
+
+
+def finish_verified_job(job_id: int) -> None:
+    from aniworld.jobqueue import finish_job, STATUS_DONE  # pylint: disable=import-outside-toplevel
+
+    finish_job(job_id, STATUS_DONE)
+
+
+def run_yt_dlp(command: list, anime: "Anime", episode: "Episode", output_path: str) -> None:
+    if get_settings().progress_events:
+        run_with_progress_events(
+            command,
+            anime=anime.title,
+            season=episode.season,
+            episode=episode.episode,
+            provider=anime.provider,
+            language=anime.language,
+            output=output_path
         )
+    else:
+        subprocess.run(command, check=True)
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        command = [
-            "yt-dlp",
-            episode.get_direct_link(),
-            "--fragment-retries", "infinite",
-            "--concurrent-fragments", "4",
-            "-o", output_path,
-            "--quiet",
-            "--no-warnings",
-            "--progress"
-        ]
-        logging.debug("Executing command:\n%s", command)
+def verifies_downloads() -> bool:
+    # -D and -C don't download anything that could be verified
+    settings = get_settings()
+    return settings.verify and not (settings.only_direct_link or settings.only_command)
 
-        if anime.provider in PROVIDER_HEADERS:
-            command.extend(["--add-header", PROVIDER_HEADERS[anime.provider]])
 
-        if arguments.only_command:
-            print(
-                f"\n{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-            )
-            print(
-                f"{' '.join(str(item) if item is not None else '' for item in command)}"
-            )
-            continue
+def download_episode(anime: "Anime", episode: "Episode", job_id: int = None) -> bool:
+    """
+    Downloads an episode and returns whether yt-dlp succeeded. If
+    verifies_downloads(), a download that runs as queue job job_id is marked
+    done once its verification passed and put back into the queue if it
+    failed.
+    """
+
+    settings = get_settings()
+    if settings.only_direct_link:
+        msg = f"{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
+        print(msg)
+        print(f"{episode.get_direct_link()}\n")
+        return True
+
+    output_path = get_output_path(anime, episode)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # the preflight already resolved the link it estimated, download exactly that
+    # one unless it's old enough to have expired at the provider
+    reused_link = episode.has_fresh_direct_link()
+    direct_link = episode.direct_link if reused_link else episode.get_direct_link()
+    command = [
+        "yt-dlp",
+        direct_link,
+        "--fragment-retries", "infinite",
+        "--concurrent-fragments", "4",
+        "-o", output_path,
+        "--quiet",
+        "--no-warnings",
+        "--progress"
+    ]
+    logging.debug("Executing command:\n%s", command)
+
+    if anime.provider in PROVIDER_HEADERS:
+        command.extend(["--add-header", PROVIDER_HEADERS[anime.provider]])
 
+    if settings.only_command:
+        print(
+            f"\n{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
+        )
+        print(
+            f"{' '.join(str(item) if item is not None else '' for item in command)}"
+        )
+        return True
+
+    try:
+        if settings.progress_events:
+            open_event_stream(settings.progress_events)
+        print(f"Downloading to {output_path}...", file=get_message_stream())
         try:
-            print(f"Downloading to {output_path}...")
-            subprocess.run(command, check=True)
+            run_yt_dlp(command, anime, episode, output_path)
         except subprocess.CalledProcessError:
-            print(
-                "Error running command:\n"
-                f"{' '.join(str(item) if item is not None else '' for item in command)}"
+            if not reused_link:
+                raise
+            logging.info(
+                "Download of S%sE%s failed with the link resolved before, resolving it again.",
+                episode.season, episode.episode
             )
-        except KeyboardInterrupt:
-            # directory containing the output_path
-            output_dir = os.path.dirname(output_path)
-            is_empty = True
-
-            # delete all .part, .ytdl, or .part-Frag followed by any number in output_path
-            for file_name in os.listdir(output_dir):
-                if re.search(r'\.(part|ytdl|part-Frag\d+)$', file_name):
-                    os.remove(os.path.join(output_dir, file_name))
-                else:
-                    is_empty = False
-
-            # delete folder too if empty after
-            if is_empty or not os.listdir(output_dir):
-                os.rmdir(output_dir)
+            direct_link = command[1] = episode.get_direct_link()
+            run_yt_dlp(command, anime, episode, output_path)
+    except subprocess.CalledProcessError:
+        print(
+            "Error running command:\n"
+            f"{' '.join(str(item) if item is not None else '' for item in command)}",
+            file=get_message_stream()
+        )
+        return False
+    except KeyboardInterrupt:
+        # directory containing the output_path
+        output_dir = os.path.dirname(output_path)
+        is_empty = True
+
+        # delete all .part, .ytdl, or .part-Frag followed by any number in output_path
+        for file_name in os.listdir(output_dir):
+            if re.search(r'\.(part|ytdl|part-Frag\d+)$', file_name):
+                os.remove(os.path.join(output_dir, file_name))
+            else:
+                is_empty = False
+
+        # delete folder too if empty after
+        if is_empty or not os.listdir(output_dir):
+            os.rmdir(output_dir)
+
+        return False
+
+    if verifies_downloads():
+        from aniworld.common import submit_verification  # pylint: disable=import-outside-toplevel
+        submit_verification(
+            output_path,
+            direct_link,
+            PROVIDER_HEADERS.get(anime.provider),
+            on_failure=lambda entry: requeue_download(
+                anime, episode, output_path, entry["reason"], job_id),
+            on_success=(lambda entry: finish_verified_job(job_id)) if job_id else None
+        )
+
+    return True
@@ -1,126 +1,227 @@
+import os
+import sys
 import getpass
+import itertools
 import subprocess
 import logging
-
-from aniworld.models import Anime
-from aniworld.config import MPV_PATH, PROVIDER_HEADERS, SYNCPLAY_PATH
+import tempfile
+import concurrent.futures
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from aniworld.config import (
+    MPV_PATH,
+    PROVIDER_HEADERS,
+    SYNCPLAY_BATCH_KEEP_WATCHING,
+    SYNCPLAY_BATCH_WORKERS,
+    SYNCPLAY_PATH
+)
 from aniworld.common import download_mpv, download_syncplay
-from aniworld.aniskip import aniskip
-from aniworld.parser import arguments
+from aniworld.settings import get_settings
+
+if TYPE_CHECKING:
+    from aniworld.models import Anime
 
 
-def syncplay(anime: Anime or None):
+def syncplay(anime: "Anime | None", local_episodes: list = None):
+    settings = get_settings()
     download_mpv()
     download_syncplay()
     if anime is None:
-        syncplay_local_file()
+        syncplay_local_file(local_episodes)
     else:
-        for episode in anime:
-            if arguments.only_direct_link:
-                msg = f"{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-                print(msg)
-                print(f"{episode.get_direct_link()}\n")
-                continue
-
-            if arguments.username:
-                syncplay_username = arguments.username
-            else:
-                syncplay_username = getpass.getuser()
-
-            if arguments.hostname:
-                syncplay_hostname = arguments.hostname
-            else:
-                syncplay_hostname = "syncplay.pl:8997"
-
-            if arguments.room:
-                room_name = arguments.room
-            else:
-                room_name = episode.title_german
-
-            command = [
-                SYNCPLAY_PATH,
-                "--no-gui",
-                "--no-store",
-                "--host", syncplay_hostname,
-                "--room", room_name,
-                "--name", syncplay_username,
-                "--player-path", MPV_PATH,
-                episode.get_direct_link(),
-                "--",
-                "--fs",
-                f'--force-media-title="{episode.title_german}"'
-            ]
-            logging.debug("Executing command:\n%s", command)
-
-            if arguments.password:
-                command.append("--password")
-                command.append(arguments.password)
-
-            if anime.provider in PROVIDER_HEADERS:
-                command.append(
-                    f"--http-header-fields={PROVIDER_HEADERS[anime.provider]}")
-
-            if anime.aniskip:
-                build_flags = aniskip(
-                    anime.title, episode.episode, episode.season)
-                sanitized_build_flags = build_flags.split()
-                command.append(sanitized_build_flags[0])
-                command.append(sanitized_build_flags[1])
-
-            if arguments.only_command:
-                print(
-                    f"\n{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-                )
-                print(
-                    f"{' '.join(str(item) if item is not None else '' for item in command)}"
-                )
-                continue
+        # the models and aniskip are only loaded for online episodes
+        # pylint: disable=import-outside-toplevel
+        from aniworld.aniskip import prefetch_aniskip, cancel_prefetch
+        from aniworld.action.watch import close_proxy, resolve_episode
 
-            try:
-                subprocess.run(command, check=True)
-            except (subprocess.CalledProcessError, TypeError):
-                print(
-                    "Error running command:\n"
-                    f"{' '.join(str(item) if item is not None else '' for item in command)}"
-                )
-
-
-def syncplay_local_file():
-    for file in arguments.local_episodes:
-        if arguments.username:
-            syncplay_username = arguments.username
-        else:
-            syncplay_username = getpass.getuser()
-
-        if arguments.hostname:
-            syncplay_hostname = arguments.hostname
-        else:
-            syncplay_hostname = "syncplay.pl:8997"
-
-        if arguments.room:
-            room_name = arguments.room
-        else:
-            room_name = file
-
-        command = [
-            SYNCPLAY_PATH,
-            "--no-gui",
-            "--no-store",
-            "--host", syncplay_hostname,
-            "--room", room_name,
-            "--name", syncplay_username,
-            "--player-path", MPV_PATH,
-            file,
-            "--",
-            "--fs"
+        if settings.syncplay_batch and not settings.only_direct_link:
+            syncplay_batch(anime)
+            return
+
+        if anime.aniskip and not settings.only_direct_link:
+            anime.on_episode_ready(lambda episode: prefetch_aniskip(
+                anime.title, [(episode.season, episode.episode)]))
+
+        try:
+            for episode in anime:
+                if settings.only_direct_link:
+                    msg = (
+                        f"{anime.title} - S{episode.season}E{episode.episode} - "
+                        f"({anime.language}):"
+                    )
+                    print(msg)
+                    print(f"{episode.get_direct_link()}\n")
+                    continue
+
+                # Syncplay owns mpv's IPC, skip times that miss the deadline are left out
+                direct_link, skip_options, _ = resolve_episode(anime, episode)
+                command = get_syncplay_command(settings.syncplay_room or episode.title_german)
+                command += [
+                    direct_link,
+                    "--",
+                    "--fs",
+                    f'--force-media-title="{episode.title_german}"'
+                ]
+                logging.debug("Executing command:\n%s", command)
+
+                if anime.provider in PROVIDER_HEADERS:
+                    command.append(
+                        f"--http-header-fields={PROVIDER_HEADERS[anime.provider]}")
+
+                command += [f"--{name}={value}" for name, value in skip_options.items()]
+
+                if settings.only_command:
+                    print(
+                        f"\n{anime.title} - S{episode.season}E{episode.episode} - "
+                        f"({anime.language}):"
+                    )
+                    print(
+                        f"{' '.join(str(item) if item is not None else '' for item in command)}"
+                    )
+                    continue
+
+                proxy = None
+                if settings.proxy:
+                    # pylint: disable=import-outside-toplevel
+                    from aniworld.common import start_proxy
+                    proxy = start_proxy(direct_link, PROVIDER_HEADERS.get(anime.provider))
+                if proxy:
+                    command[command.index(direct_link)] = proxy.url
+
+                try:
+                    subprocess.run(command, check=True)
+                except (subprocess.CalledProcessError, TypeError):
+                    print(
+                        "Error running command:\n"
+                        f"{' '.join(str(item) if item is not None else '' for item in command)}"
+                    )
+                finally:
+                    close_proxy(anime, episode, proxy)
+        finally:
+            # skip times of episodes that were never reached
+            cancel_prefetch()
+
+
+def get_syncplay_command(room_name: str) -> list:
+    settings = get_settings()
+    # the files to play and the mpv arguments after "--" are added by the caller
+    command = [
+        SYNCPLAY_PATH,
+        "--no-gui",
+        "--no-store",
+        "--host", settings.syncplay_hostname or "syncplay.pl:8997",
+        "--room", room_name,
+        "--name", settings.syncplay_username or getpass.getuser(),
+        "--player-path", MPV_PATH
+    ]
+
+    if settings.syncplay_password:
+        command += ["--password", settings.syncplay_password]
+
+    return command
+
+
+def resolve_direct_links(episodes) -> list:
+    """
+    Resolves the direct links of all episodes concurrently and returns
+    (episode, direct_link) pairs in order. Episodes whose link can't be
+    resolved are left out.
+    """
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=SYNCPLAY_BATCH_WORKERS, thread_name_prefix="syncplay-batch")
+    with executor:
+        # episodes are submitted as soon as they are built, so the links of the
+        # first ones resolve while --keep-watching still looks up the next ones
+        futures = [
+            (episode, executor.submit(episode.get_direct_link)) for episode in episodes
         ]
-        logging.debug("Executing command:\n%s", command)
 
-        if arguments.password:
-            command.append("--password")
-            command.append(arguments.password)
+        resolved = []
+        for number, (episode, future) in enumerate(futures, 1):
+            if sys.stdout.isatty():
+                print(f"\rResolving episode {number}/{len(futures)}...", end="", flush=True)
+            try:
+                resolved.append((episode, future.result()))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.error(
+                    "Could not resolve S%sE%s: %s", episode.season, episode.episode, e)
+        if sys.stdout.isatty():
+            print("\r\033[K", end="", flush=True)
+
+    return resolved
+
+
+def syncplay_batch(anime: "Anime") -> None:
+    """
+    Plays all episodes in a single Syncplay session.
+
+    The direct links are resolved up front and loaded into the room's
+    shared playlist, which Syncplay advances for everyone when an episode
+    ends. Nobody reconnects or restarts mpv between episodes. Episodes
+    added by --keep-watching are limited to SYNCPLAY_BATCH_KEEP_WATCHING.
+    """
+
+    settings = get_settings()
+    from aniworld.action.watch import get_episodes  # pylint: disable=import-outside-toplevel
+
+    if anime.aniskip:
+        logging.warning("Skip times can't be set per episode in a Syncplay batch, ignoring -k.")
+    if settings.proxy:
+        # the links in the shared playlist have to work for every participant
+        logging.warning("A Syncplay batch can't be played through the proxy, ignoring --proxy.")
+
+    episodes = itertools.islice(
+        get_episodes(anime), len(anime.episode_list) + SYNCPLAY_BATCH_KEEP_WATCHING)
+    resolved = resolve_direct_links(episodes)
+    if not resolved:
+        return
+
+    # participants starting the same batch meet in the same room
+    command = get_syncplay_command(settings.syncplay_room or anime.title)
+
+    descriptor, playlist_path = tempfile.mkstemp(prefix="aniworld-syncplay-", suffix=".txt")
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+        f.writelines(f"{direct_link}\n" for _, direct_link in resolved)
+
+    command += ["--load-playlist-from-file", playlist_path, "--", "--fs"]
+    if anime.provider in PROVIDER_HEADERS:
+        command.append(f"--http-header-fields={PROVIDER_HEADERS[anime.provider]}")
+    logging.debug("Executing command:\n%s", command)
+
+    if settings.only_command:
+        # the playlist file is kept for the printed command
+        print(f"\n{anime.title} - {len(resolved)} episodes ({anime.language}):")
+        print(f"{' '.join(str(item) if item is not None else '' for item in command)}")
+        return
+
+    hosts = sorted({urlparse(direct_link).hostname for _, direct_link in resolved})
+    print(
+        f"Loading {len(resolved)} episodes into the shared playlist. Syncplay only "
+        f"opens links from its trusted domains, add {', '.join(hosts)} if it refuses."
+    )
+
+    try:
+        subprocess.run(command, check=True)
+    except (subprocess.CalledProcessError, TypeError):
+        # TypeError: SYNCPLAY_PATH or MPV_PATH is None, the tool isn't installed
+        print(
+            "Error running command:\n"
+            f"{' '.join(str(item) if item is not None else '' for item in command)}"
+        )
+    finally:
+        os.remove(playlist_path)
+
+
+def syncplay_local_file(local_episodes: list):
+    settings = get_settings()
+    for file in local_episodes:
+        command = get_syncplay_command(settings.syncplay_room or file)
+        command += [file, "--", "--fs"]
+        logging.debug("Executing command:\n%s", command)
 
-        if arguments.only_command:
+        if settings.only_command:
             print(
                 f"\n{file}:"
             )
@@ -1,81 +1,342 @@
+import time
 import subprocess
 import logging
+import threading
+import concurrent.futures
+from typing import TYPE_CHECKING
 
-from aniworld.aniskip import aniskip
-from aniworld.common import download_mpv
-from aniworld.config import MPV_PATH, PROVIDER_HEADERS
-from aniworld.models import Anime
-from aniworld.parser import arguments
+from aniworld.common import (
+    download_mpv,
+    get_ipc_path,
+    get_tool_version,
+    MpvPlayer
+)
+from aniworld.config import MPV_IPC_MIN_VERSION, MPV_PATH, PROVIDER_HEADERS
+from aniworld.settings import get_settings
 
+if TYPE_CHECKING:
+    from aniworld.models import Anime
 
-def watch(anime: Anime or None):
+
+def watch(anime: "Anime | None", local_episodes: list = None):
+    settings = get_settings()
     download_mpv()
     if anime is None:
-        watch_local_file()
+        watch_local_file(local_episodes)
     else:
-        for episode in anime:
-            if arguments.only_direct_link:
-                msg = f"{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-                print(msg)
-                print(f"{episode.get_direct_link()}\n")
-                continue
-
-            if (episode.has_movies and episode.season
-                    not in list(episode.season_episode_count.keys())):
-                mpv_title = (
-                    f"{anime.title} - Movie {episode.episode} - "
-                    f"{episode.title_german}"
-                )
-            else:
-                mpv_title = (
-                    f"{anime.title} - S{episode.season}E{episode.episode} - "
-                    f"{episode.title_german}"
-                )
+        # the models and aniskip are only loaded for online episodes
+        # pylint: disable=import-outside-toplevel
+        from aniworld.aniskip import prefetch_aniskip, cancel_prefetch
 
-            command = [
-                MPV_PATH,
-                episode.get_direct_link(),
-                "--fs",
-                "--quiet",
-                f'--force-media-title="{mpv_title}"'
-            ]
-            logging.debug("Executing command:\n%s", command)
-
-            # print(anime.provider)
-            # print(bool(anime.provider in PROVIDER_HEADERS))
-
-            if anime.provider in PROVIDER_HEADERS:
-                command.append(
-                    f"--http-header-fields={PROVIDER_HEADERS[anime.provider]}")
-
-            if anime.aniskip:
-                build_flags = aniskip(
-                    anime.title, episode.episode, episode.season)
-                sanitized_build_flags = build_flags.split()
-                command.append(sanitized_build_flags[0])
-                command.append(sanitized_build_flags[1])
-
-            if arguments.only_command:
-                print(
-                    f"\n{anime.title} - S{episode.season}E{episode.episode} - ({anime.language}):"
-                )
-                print(
-                    f"{' '.join(str(item) if item is not None else '' for item in command)}"
+        if anime.aniskip and not settings.only_direct_link:
+            anime.on_episode_ready(lambda episode: prefetch_aniskip(
+                anime.title, [(episode.season, episode.episode)]))
+
+        try:
+            if use_persistent_mpv():
+                watch_in_mpv(anime)
+                return
+
+            for episode in get_episodes(anime):
+                if settings.only_direct_link:
+                    msg = (
+                        f"{anime.title} - S{episode.season}E{episode.episode} - "
+                        f"({anime.language}):"
+                    )
+                    print(msg)
+                    print(f"{episode.get_direct_link()}\n")
+                    continue
+
+                started = time.monotonic() if settings.debug else None
+                direct_link, skip_options, skip_times = resolve_episode(anime, episode)
+                command = [
+                    MPV_PATH,
+                    direct_link,
+                    "--fs",
+                    "--quiet",
+                    f'--force-media-title="{get_mpv_title(anime, episode)}"'
+                ]
+                logging.debug("Executing command:\n%s", command)
+
+                # print(anime.provider)
+                # print(bool(anime.provider in PROVIDER_HEADERS))
+
+                if anime.provider in PROVIDER_HEADERS:
+                    command.append(
+                        f"--http-header-fields={PROVIDER_HEADERS[anime.provider]}")
+
+                command += [f"--{name}={value}" for name, value in skip_options.items()]
+
+                if settings.only_command:
+                    print(
+                        f"\n{anime.title} - S{episode.season}E{episode.episode} - "
+                        f"({anime.language}):"
+                    )
+                    print(
+                        f"{' '.join(str(item) if item is not None else '' for item in command)}"
+                    )
+                    continue
+
+                proxy = None
+                if settings.proxy:
+                    # pylint: disable=import-outside-toplevel
+                    from aniworld.common import start_proxy
+                    proxy = start_proxy(command[1], PROVIDER_HEADERS.get(anime.provider))
+                if proxy:
+                    command[1] = proxy.url
+
+                if skip_times is not None or started is not None:
+                    ipc_path = get_ipc_path()
+                    command.append(f"--input-ipc-server={ipc_path}")
+                    follow_playback(ipc_path, command[1], episode, started, skip_times)
+
+                try:
+                    subprocess.run(command, check=True, shell=False)
+                except subprocess.CalledProcessError as e:
+                    logging.error(
+                        "Error running command: %s\nCommand: %s",
+                        e, ' '.join(
+                            str(item) if item is not None else '' for item in command)
+                    )
+                finally:
+                    close_proxy(anime, episode, proxy)
+        finally:
+            # skip times of episodes that were never reached
+            cancel_prefetch()
+
+
+def get_mpv_title(anime: "Anime", episode) -> str:
+    if (episode.has_movies and episode.season
+            not in list(episode.season_episode_count.keys())):
+        return f"{anime.title} - Movie {episode.episode} - {episode.title_german}"
+    return f"{anime.title} - S{episode.season}E{episode.episode} - {episode.title_german}"
+
+
+def get_episodes(anime: "Anime"):
+    settings = get_settings()
+    # with --keep-watching the series continues after the selected episodes
+    episode = None
+    for episode in anime:
+        yield episode
+
+    if not settings.keep_watching or settings.only_direct_link or settings.only_command:
+        return
+
+    from aniworld.models import get_next_episode  # pylint: disable=import-outside-toplevel
+
+    while episode is not None:
+        episode = get_next_episode(episode, anime.provider, anime.language)
+        if episode is not None:
+            yield episode
+
+
+def close_proxy(anime: "Anime", episode, proxy) -> None:
+    if proxy is None:
+        return
+
+    persist_path = None
+    if get_settings().proxy_persist:
+        # pylint: disable=import-outside-toplevel
+        from aniworld.action.download import get_output_path
+        persist_path = get_output_path(anime, episode)
+    path = proxy.close(persist_path)
+    if path:
+        print(f"Kept the episode at {path}")
+
+
+def use_persistent_mpv() -> bool:
+    settings = get_settings()
+    if not settings.keep_watching or settings.only_direct_link or settings.only_command:
+        return False
+
+    version = get_tool_version("mpv")
+    if version and version < MPV_IPC_MIN_VERSION:
+        logging.warning(
+            "mpv %s is too old to keep playing in one window, starting it per episode.",
+            ".".join(map(str, version))
+        )
+        return False
+    return True
+
+
+def resolve_episode(anime: "Anime", episode) -> tuple:
+    """
+    Resolves the direct link of an episode while its skip times are fetched
+    concurrently. Returns (direct_link, skip_options, skip_times): the mpv
+    options of the skip times, and if they missed --aniskip-deadline, the
+    future they arrive with later, see follow_playback().
+    """
+
+    settings = get_settings()
+    if not anime.aniskip:
+        return episode.get_direct_link(), {}, None
+
+    # pylint: disable=import-outside-toplevel
+    from aniworld.aniskip import skip_times_options, start_aniskip
+
+    started = time.monotonic()
+    skip_times = start_aniskip(anime.title, episode.episode, episode.season)
+    direct_link = episode.get_direct_link()
+
+    # printed commands are run later, they can wait for the skip times
+    if not settings.only_command:
+        remaining = started + settings.aniskip_deadline - time.monotonic()
+        done, _ = concurrent.futures.wait([skip_times], timeout=max(remaining, 0))
+        if not done:
+            logging.info(
+                "Skip times of S%sE%s aren't ready yet, starting without them.",
+                episode.season, episode.episode
+            )
+            return direct_link, {}, skip_times
+
+    return direct_link, skip_times_options(episode.episode, skip_times), None
+
+
+def follow_playback(
+    ipc_path: str,
+    url: str,
+    episode,
+    started: float = None,
+    skip_times: concurrent.futures.Future = None
+) -> None:
+    """
+    Follows an episode in mpv over a second IPC connection in the
+    background. Logs the time to its first frame since `started` and adds
+    skip times that missed the deadline to it once they arrive.
+    """
+
+    from aniworld.aniskip import apply_skip_times  # pylint: disable=import-outside-toplevel
+
+    def follow() -> None:
+        try:
+            player = MpvPlayer(ipc_path=ipc_path)
+        except OSError as e:
+            logging.debug("Could not connect to mpv at %s: %s", ipc_path, e)
+            return
+
+        try:
+            if not player.wait_until_playing(url):
+                return
+            if started is not None:
+                logging.debug(
+                    "Time to first frame of S%sE%s: %.2fs",
+                    episode.season, episode.episode, time.monotonic() - started
                 )
-                continue
 
+            if skip_times is None:
+                return
+            # failed lookups resolve to no skip times
+            _, metadata = skip_times.result()
+            if metadata and player.get_property("path") == url:
+                apply_skip_times(player, metadata)
+                logging.info("Added the skip times to S%sE%s.", episode.season, episode.episode)
+        finally:
+            player.close()
+
+    threading.Thread(target=follow, name="mpv-follow", daemon=True).start()
+
+
+def get_mpv_entry(anime: "Anime", episode) -> tuple:
+    direct_link, skip_options, skip_times = resolve_episode(anime, episode)
+    options = {"force-media-title": get_mpv_title(anime, episode)}
+
+    if anime.provider in PROVIDER_HEADERS:
+        options["http-header-fields"] = PROVIDER_HEADERS[anime.provider]
+
+    options.update(skip_options)
+    return direct_link, options, skip_times
+
+
+def watch_in_mpv(anime: "Anime") -> None:
+    """
+    Plays all episodes in a single mpv instance controlled over its IPC.
+
+    While one episode plays, the direct link and skip times of the next one
+    are resolved in the background and it is appended to mpv's playlist, so
+    it starts right away without restarting the player. Closing mpv stops
+    watching.
+    """
+
+    settings = get_settings()
+    started = time.monotonic() if settings.debug else None
+    episodes = get_episodes(anime)
+
+    def resolve_next() -> tuple or None:
+        for episode in episodes:
             try:
-                subprocess.run(command, check=True, shell=False)
-            except subprocess.CalledProcessError as e:
+                url, options, skip_times = get_mpv_entry(anime, episode)
+                proxy = None
+                if settings.proxy:
+                    # pylint: disable=import-outside-toplevel
+                    from aniworld.common import start_proxy
+                    proxy = start_proxy(url, options.get("http-header-fields"))
+                return episode, proxy.url if proxy else url, options, proxy, skip_times
+            except Exception as e:  # pylint: disable=broad-exception-caught
                 logging.error(
-                    "Error running command: %s\nCommand: %s",
-                    e, ' '.join(
-                        str(item) if item is not None else '' for item in command)
-                )
+                    "Could not resolve S%sE%s: %s", episode.season, episode.episode, e)
+        return None
+
+    # the scripts used to be installed only with --aniskip, an outdated autoexit.lua
+    # has no enabled option and would quit the shared mpv after the first episode
+    from aniworld.aniskip import setup_mpv_scripts  # pylint: disable=import-outside-toplevel
+    setup_mpv_scripts()
+
+    try:
+        player = MpvPlayer(MPV_PATH, [
+            "--fs",
+            "--quiet",
+            # the playlist decides when mpv quits, not autoexit.lua
+            "--script-opts-append=autoexit-enabled=no"
+        ])
+    except OSError as e:
+        logging.error("Could not start mpv: %s", e)
+        return
+
+    def close_unused(future):
+        # an episode resolved ahead but never appended
+        if not future.cancelled() and future.exception() is None and future.result():
+            episode, _, _, proxy, _ = future.result()
+            close_proxy(anime, episode, proxy)
+
+    # (episode, proxy) of the playlist entries that may still be playing
+    playlist = []
+    future = None
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="mpv-next")
+    try:
+        future = executor.submit(resolve_next)
+        while not player.closed:
+            entry = future.result()
+            if entry is None:
+                player.wait_until_idle()
+                break
+
+            episode, url, options, proxy, skip_times = entry
+            player.append(url, options)
+            playlist.append((episode, proxy))
+            if skip_times is not None or started is not None:
+                follow_playback(player.ipc_path, url, episode, started, skip_times)
+            # only the first episode's time to first frame is measured from the start
+            started = None
+            # resolve the following episode while this one plays
+            future = executor.submit(resolve_next)
+            player.wait_until_playing_last()
+
+            # everything before the entry that just started has finished
+            while len(playlist) > 1:
+                close_proxy(anime, *playlist.pop(0))
+    finally:
+        if future is not None:
+            future.add_done_callback(close_unused)
+        executor.shutdown(wait=False)
+        player.quit()
+        for episode, proxy in playlist:
+            close_proxy(anime, episode, proxy)
 
 
-def watch_local_file():
-    for file in arguments.local_episodes:
+def watch_local_file(local_episodes: list):
+    settings = get_settings()
+    for file in local_episodes:
         command = [
             MPV_PATH,
             f'{file}',
@@ -84,7 +345,7 @@ def watch_local_file():
         ]
         logging.debug("Executing command:\n%s", command)
 
-        if arguments.only_command:
+        if settings.only_command:
             print(
                 f"\n{file}:"
             )
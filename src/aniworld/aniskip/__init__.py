@@ -1 +1,11 @@
-from .aniskip import get_mal_id_from_title, aniskip
+from .aniskip import (
+    get_mal_id_from_title,
+    aniskip,
+    aniskip_options,
+    apply_skip_times,
+    skip_times_options,
+    start_aniskip,
+    prefetch_aniskip,
+    cancel_prefetch,
+    setup_mpv_scripts
+)
@@ -1,6 +1,9 @@
 import re
+import time
+import hashlib
 import logging
-import tempfile
+import threading
+import concurrent.futures
 from typing import Dict
 import os
 import shutil
@@ -8,7 +11,16 @@ import shutil
 import requests
 from bs4 import BeautifulSoup
 
-from aniworld.config import DEFAULT_REQUEST_TIMEOUT, MPV_SCRIPTS_DIRECTORY
+from aniworld.common import JsonCache, MpvPlayer
+from aniworld.aniskip.dataset import find_mal_id, find_sequel_id
+from aniworld.config import (
+    DEFAULT_REQUEST_TIMEOUT,
+    MPV_SCRIPTS_DIRECTORY,
+    DEFAULT_ANISKIP_PREFETCH_WORKERS,
+    CHAPTERS_DIRECTORY,
+    CHAPTERS_CACHE_MAX_AGE,
+    CHAPTERS_CACHE_MAX_SIZE
+)
 
 CHAPTER_FORMAT = "\n[CHAPTER]\nTIMEBASE=1/1000\nSTART={}\nEND={}\nTITLE={}\n"
 OPTION_FORMAT = "skip-{}_start={},skip-{}_end={}"
@@ -16,12 +28,47 @@ MAL_ANIME_URL = "https://myanimelist.net/anime/{}"
 MAL_SEARCH_URL = "https://myanimelist.net/search/prefix.json?type=anime&keyword={}"
 ANISKIP_API_URL = "https://api.aniskip.com/v1/skip-times/{}/{}?types=op&types=ed"
 
+# (title, season) -> MAL ID and MAL ID -> MAL ID of the sequel (TV),
+# neither changes so each lookup happens once per series
+MAL_ID_CACHE = JsonCache("mal_ids")
+MAL_SEQUEL_CACHE = JsonCache("mal_sequels")
+# "<MAL ID>|<episode>" -> aniskip API response
+SKIP_TIMES_CACHE = JsonCache("skip_times")
+# MAL ID -> episode count, airing shows still get new episodes
+EPISODE_COUNT_CACHE = JsonCache("mal_episode_counts", ttl=24 * 60 * 60)
+# MAL lists airing shows with "Unknown" episodes until their last one aired
+EPISODES_UNKNOWN = "Unknown"
+EPISODES_UNKNOWN_TTL = 60 * 60
+# destination path -> (mtime, size) of source and destination when last installed
+MPV_SCRIPTS_CACHE = JsonCache("mpv_scripts")
+MPV_SCRIPTS = ['autostart.lua', 'autoexit.lua', 'aniskip.lua']
+
+_mpv_scripts_installed = False
+_chapters_pruned = False
+
+_prefetch_executor = None
+_prefetch_futures = {}
+# episodes may report in from several threads
+_prefetch_lock = threading.Lock()
+# concurrent prefetches of one season must not search MAL more than once
+_mal_lock = threading.Lock()
+
 
 def ftoi(value: float) -> str:
     return str(int(value * 1000))
 
 
-def check_episodes(anime_id):
+def check_episodes(anime_id) -> int or str or None:
+    """
+    Returns the episode count MyAnimeList lists for anime_id, or
+    EPISODES_UNKNOWN for airing shows, whose count can't be validated but
+    is accepted. None means the page has no episode count at all.
+    """
+
+    episodes = EPISODE_COUNT_CACHE.get(str(anime_id))
+    if episodes:
+        return episodes
+
     response = requests.get(
         MAL_ANIME_URL.format(anime_id),
         timeout=DEFAULT_REQUEST_TIMEOUT
@@ -32,7 +79,13 @@ def check_episodes(anime_id):
     if episodes_span and episodes_span.parent:
         episodes = episodes_span.parent.text.replace("Episodes:", "").strip()
         logging.debug("Count of the episodes %s", episodes)
-        return int(episodes)
+        if episodes.isdigit():
+            EPISODE_COUNT_CACHE.set(str(anime_id), int(episodes))
+            return int(episodes)
+        if episodes == EPISODES_UNKNOWN:
+            # checked again sooner, the count appears once the show finished
+            EPISODE_COUNT_CACHE.set(str(anime_id), EPISODES_UNKNOWN, ttl=EPISODES_UNKNOWN_TTL)
+            return EPISODES_UNKNOWN
 
     logging.warning("The Number can not be found!")
     return None
@@ -42,6 +95,26 @@ def get_mal_id_from_title(title: str, season: int) -> int:
     logging.debug("Fetching MAL ID for: %s", title)
 
     name = re.sub(r' \(\d+ episodes\)', '', title)
+    cache_key = f"{name.lower()}|{season}"
+
+    anime_id = MAL_ID_CACHE.get(cache_key)
+    if anime_id:
+        logging.debug("Found cached MAL ID: %s for %s", anime_id, cache_key)
+        return anime_id
+
+    # the offline dataset answers most lookups, MyAnimeList is the fallback
+    anime_id = find_mal_id(name, season)
+    if not anime_id and season > 1:
+        anime_id = get_sequel_anime_id(get_mal_id_from_title(title, season - 1))
+    elif not anime_id:
+        anime_id = search_mal_id(name)
+
+    if anime_id:
+        MAL_ID_CACHE.set(cache_key, anime_id)
+    return anime_id
+
+
+def search_mal_id(name: str) -> int:
     keyword = re.sub(r'\s+', '%20', name)
 
     response = requests.get(
@@ -69,14 +142,23 @@ def get_mal_id_from_title(title: str, season: int) -> int:
     anime_id = best_match['id']
     logging.debug("Found MAL ID: %s for %s", anime_id, best_match)
 
-    while season > 1:
-        anime_id = get_sequel_anime_id(anime_id)
-        season -= 1
-
     return anime_id
 
 
 def get_sequel_anime_id(anime_id: int) -> int:
+    if not anime_id:
+        return 0
+
+    sequel_id = MAL_SEQUEL_CACHE.get(str(anime_id))
+    if sequel_id:
+        return sequel_id
+
+    sequel_id = find_sequel_id(anime_id) or fetch_sequel_anime_id(anime_id)
+    MAL_SEQUEL_CACHE.set(str(anime_id), sequel_id)
+    return sequel_id
+
+
+def fetch_sequel_anime_id(anime_id: int) -> int:
     url = MAL_ANIME_URL.format(anime_id)
     response = requests.get(url, timeout=DEFAULT_REQUEST_TIMEOUT)
     response.raise_for_status()
@@ -102,11 +184,12 @@ def get_sequel_anime_id(anime_id: int) -> int:
     if not match:
         raise ValueError("No Anime-ID found in the link URL")
 
-    return match.group(1)
+    return int(match.group(1))
 
 
-def build_options(metadata: Dict, chapters_file: str) -> str:
+def build_options(metadata: Dict) -> tuple[str, str]:
     op_end, ed_start = None, None
+    chapters = [";FFMETADATA1"]
     options = []
 
     for skip in metadata["results"]:
@@ -120,63 +203,250 @@ def build_options(metadata: Dict, chapters_file: str) -> str:
         elif skip_type == "ed":
             ed_start = st_time
 
-        with open(chapters_file, 'a', encoding='utf-8') as f:
-            f.write(CHAPTER_FORMAT.format(
-                ftoi(st_time), ftoi(ed_time), ch_name))
+        chapters.append(CHAPTER_FORMAT.format(
+            ftoi(st_time), ftoi(ed_time), ch_name))
 
         options.append(OPTION_FORMAT.format(
             skip_type, st_time, skip_type, ed_time))
 
     if op_end:
         ep_ed = ed_start if ed_start else op_end
-        with open(chapters_file, 'a', encoding='utf-8') as f:
-            f.write(CHAPTER_FORMAT.format(
-                ftoi(op_end), ftoi(ep_ed), "Episode"))
+        chapters.append(CHAPTER_FORMAT.format(
+            ftoi(op_end), ftoi(ep_ed), "Episode"))
+
+    return "".join(chapters), ",".join(options)
+
+
+def build_chapter_list(metadata: Dict) -> list[Dict]:
+    # the chapters of build_options() in the form of mpv's chapter-list property
+    chapters, op_end, ed_start = [], None, None
+    for skip in metadata["results"]:
+        skip_type = skip["skip_type"]
+        if skip_type == "op":
+            op_end = skip["interval"]["end_time"]
+        elif skip_type == "ed":
+            ed_start = skip["interval"]["start_time"]
+        chapters.append({
+            "title": "Opening" if skip_type == "op" else "Ending" if skip_type == "ed" else None,
+            "time": skip["interval"]["start_time"]
+        })
+
+    if op_end:
+        chapters.append({"title": "Episode", "time": op_end})
+
+    return sorted(chapters, key=lambda chapter: chapter["time"])
+
+
+def write_chapters_file(anime_id: int, episode: int, chapters: str) -> str:
+    # content addressed, a replay reuses the file and changed skip times get a new one
+    digest = hashlib.sha256(chapters.encode('utf-8')).hexdigest()[:16]
+    chapters_file = os.path.join(
+        CHAPTERS_DIRECTORY, f"{anime_id}-{episode}-{digest}.txt")
+
+    if os.path.exists(chapters_file):
+        # keeps recently watched episodes from being pruned
+        os.utime(chapters_file)
+        return chapters_file
+
+    os.makedirs(CHAPTERS_DIRECTORY, exist_ok=True)
+    temporary_path = f"{chapters_file}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write(chapters)
+    os.replace(temporary_path, chapters_file)
+
+    return chapters_file
+
+
+def prune_chapters_cache(
+    max_age: float = CHAPTERS_CACHE_MAX_AGE,
+    max_size: int = CHAPTERS_CACHE_MAX_SIZE
+) -> None:
+    if not os.path.isdir(CHAPTERS_DIRECTORY):
+        return
+
+    files = []
+    for entry in os.scandir(CHAPTERS_DIRECTORY):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    now = time.time()
+    total_size = sum(size for _, size, _ in files)
 
-    return ",".join(options)
+    # oldest first, drop everything expired and then until the size fits
+    for mtime, size, path in sorted(files):
+        if now - mtime <= max_age and total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError as e:
+            logging.debug("Could not remove %s: %s", path, e)
 
 
-def build_flags(anime_id: str, episode: int, chapters_file: str) -> str:
+def get_skip_times(anime_id: int, episode: int) -> Dict or None:
+    cache_key = f"{anime_id}|{episode}"
+    metadata = SKIP_TIMES_CACHE.get(cache_key)
+    if metadata:
+        return metadata
+
     aniskip_api = ANISKIP_API_URL.format(anime_id, episode)
     response = requests.get(aniskip_api, timeout=DEFAULT_REQUEST_TIMEOUT)
 
     if response.status_code == 500:
         logging.info("Aniskip API is currently not working!")
-        return ""
+        return None
     if response.status_code != 200:
         logging.info("Failed to fetch AniSkip data.")
-        return ""
+        return None
 
     metadata = response.json()
 
     if not metadata.get("found"):
         logging.warning("No skip times found.")
-        return ""
+        return None
 
-    with open(chapters_file, 'w', encoding='utf-8') as f:
-        f.write(";FFMETADATA1")
+    SKIP_TIMES_CACHE.set(cache_key, metadata)
+    return metadata
 
-    options = build_options(metadata, chapters_file)
-    return f"--chapters-file={chapters_file} --script-opts={options}"
 
+def build_mpv_options(anime_id: str, episode: int, metadata: Dict = None) -> Dict:
+    metadata = metadata or get_skip_times(anime_id, episode)
+    if not metadata:
+        return {}
+
+    chapters, options = build_options(metadata)
+    chapters_file = write_chapters_file(anime_id, episode, chapters)
+    return {"chapters-file": chapters_file, "script-opts": options}
+
+
+def build_flags(anime_id: str, episode: int, metadata: Dict = None) -> str:
+    return " ".join(
+        f"--{name}={value}"
+        for name, value in build_mpv_options(anime_id, episode, metadata).items()
+    )
+
+
+def resolve_skip_times(title: str, episode: int, season: int) -> tuple:
+    # failed lookups only mean playing without skips, e.g. "No match found!" or
+    # a later season without a MAL sequel
+    try:
+        with _mal_lock:
+            anime_id = get_mal_id_from_title(
+                title, season) if not title.isdigit() else title
+        if not anime_id:
+            return None, None
+
+        if not check_episodes(anime_id):
+            logging.warning("Mal ID isn't matching episode counter!")
+            return anime_id, None
+
+        return anime_id, get_skip_times(anime_id, episode)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.warning("Could not fetch the skip times of S%sE%s: %s", season, episode, e)
+        return None, None
 
-def aniskip(title: str, episode: int, season: int) -> str:
-    setup_autostart()
-    setup_autoexit()
-    setup_aniskip()
 
-    anime_id = get_mal_id_from_title(
-        title, season) if not title.isdigit() else title
+def prefetch_aniskip(title: str, episodes: list[tuple[int, int]]) -> None:
+    """
+    Starts fetching the skip times of all given (season, episode) pairs in
+    the background, so aniskip() doesn't have to wait for the API when the
+    episode is about to start.
+
+    Example:
+        prefetch_aniskip("Kaguya-sama: Love is War", [(1, 1), (1, 2), (2, 1)])
+    """
+
+    with _prefetch_lock:
+        for season, episode in episodes:
+            key = (title, season, episode)
+            if key not in _prefetch_futures:
+                _prefetch_futures[key] = get_prefetch_executor().submit(
+                    resolve_skip_times, title, episode, season)
+
+
+def get_prefetch_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _prefetch_executor  # pylint: disable=global-statement
+
+    if _prefetch_executor is None:
+        _prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=DEFAULT_ANISKIP_PREFETCH_WORKERS,
+            thread_name_prefix="aniskip"
+        )
+    return _prefetch_executor
+
+
+def cancel_prefetch() -> None:
+    with _prefetch_lock:
+        for future in _prefetch_futures.values():
+            future.cancel()
+        _prefetch_futures.clear()
+
+
+def start_aniskip(title: str, episode: int, season: int) -> concurrent.futures.Future:
+    """
+    Starts resolving the skip times of an episode in the background, or
+    takes over its prefetch, so they can be fetched while the direct link
+    is resolved. The future resolves to (anime_id, metadata), pass it to
+    skip_times_options() for the mpv options.
+    """
+
+    global _chapters_pruned  # pylint: disable=global-statement
+
+    setup_mpv_scripts()
+
+    if not _chapters_pruned:
+        prune_chapters_cache()
+        _chapters_pruned = True
+
+    with _prefetch_lock:
+        future = _prefetch_futures.pop((title, season, episode), None)
+        if future is None or future.cancelled():
+            future = get_prefetch_executor().submit(resolve_skip_times, title, episode, season)
+    return future
+
+
+def skip_times_options(episode: int, skip_times: concurrent.futures.Future) -> Dict:
+    anime_id, metadata = skip_times.result()
     if not anime_id:
         logging.warning("No MAL ID found.")
-        return ""
+        return {}
 
-    if check_episodes(anime_id):
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False) as chapters_file:
-            return build_flags(anime_id, episode, chapters_file.name)
-    else:
-        logging.warning("Mal ID isn't matching episode counter!")
-        return ""
+    if not metadata:
+        return {}
+
+    return build_mpv_options(anime_id, episode, metadata)
+
+
+def aniskip_options(title: str, episode: int, season: int) -> Dict:
+    """
+    Returns the mpv options that skip the opening and ending of an episode,
+    e.g. {"chapters-file": "...", "script-opts": "skip-op_start=..."},
+    or an empty dict if there are no skip times.
+    """
+
+    return skip_times_options(episode, start_aniskip(title, episode, season))
+
+
+def apply_skip_times(player: MpvPlayer, metadata: Dict) -> None:
+    """
+    Adds skip times to the file a running mpv is playing, for skip times
+    that arrived after playback started. They only apply to that file,
+    mpv drops them when the next one starts.
+    """
+
+    _, options = build_options(metadata)
+    script_opts = player.get_property("script-opts") or {}
+    script_opts.update(option.split("=", 1) for option in options.split(","))
+    player.command("set_property", "file-local-options/script-opts", script_opts)
+    player.command("set_property", "chapter-list", build_chapter_list(metadata))
+
+
+def aniskip(title: str, episode: int, season: int) -> str:
+    return " ".join(
+        f"--{name}={value}"
+        for name, value in aniskip_options(title, episode, season).items()
+    )
 
 
 def copy_file_if_different(source_path, destination_path):
@@ -207,53 +477,58 @@ def copy_file_if_different(source_path, destination_path):
         shutil.copy(source_path, destination_path)
 
 
-def setup_aniskip():
-    script_directory = os.path.dirname(
-        os.path.dirname(os.path.abspath(__file__)))
-    mpv_scripts_directory = MPV_SCRIPTS_DIRECTORY
+def get_file_signature(path: str) -> list or None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
 
-    if not os.path.exists(mpv_scripts_directory):
-        os.makedirs(mpv_scripts_directory)
 
-    skip_source_path = os.path.join(
-        script_directory, 'aniskip', 'scripts', 'aniskip.lua')
-    skip_destination_path = os.path.join(mpv_scripts_directory, 'aniskip.lua')
+def install_mpv_script(name: str) -> None:
+    source_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'scripts', name)
+    destination_path = os.path.join(MPV_SCRIPTS_DIRECTORY, name)
 
-    copy_file_if_different(skip_source_path, skip_destination_path)
+    # comparing stats is enough if neither file changed since the last run
+    signature = [get_file_signature(source_path), get_file_signature(destination_path)]
+    if signature[1] and MPV_SCRIPTS_CACHE.get(destination_path) == signature:
+        logging.debug("%s is up to date", name)
+        return
 
+    if not os.path.exists(MPV_SCRIPTS_DIRECTORY):
+        os.makedirs(MPV_SCRIPTS_DIRECTORY)
 
-def setup_autostart():
-    logging.debug("Copying autostart.lua to mpv script directory")
-    script_directory = os.path.dirname(
-        os.path.dirname(os.path.abspath(__file__)))
-    mpv_scripts_directory = MPV_SCRIPTS_DIRECTORY
+    copy_file_if_different(source_path, destination_path)
+    MPV_SCRIPTS_CACHE.set(
+        destination_path,
+        [get_file_signature(source_path), get_file_signature(destination_path)]
+    )
 
-    if not os.path.exists(mpv_scripts_directory):
-        os.makedirs(mpv_scripts_directory)
 
-    autostart_source_path = os.path.join(
-        script_directory, 'aniskip', 'scripts', 'autostart.lua')
-    autostart_destination_path = os.path.join(
-        mpv_scripts_directory, 'autostart.lua')
+def setup_mpv_scripts():
+    global _mpv_scripts_installed  # pylint: disable=global-statement
 
-    copy_file_if_different(autostart_source_path, autostart_destination_path)
+    if _mpv_scripts_installed:
+        return
 
+    for name in MPV_SCRIPTS:
+        install_mpv_script(name)
+    _mpv_scripts_installed = True
 
-def setup_autoexit():
-    logging.debug("Copying autoexit.lua to mpv script directory")
-    script_directory = os.path.dirname(
-        os.path.dirname(os.path.abspath(__file__)))
-    mpv_scripts_directory = MPV_SCRIPTS_DIRECTORY
 
-    if not os.path.exists(mpv_scripts_directory):
-        os.makedirs(mpv_scripts_directory)
+def setup_aniskip():
+    install_mpv_script('aniskip.lua')
+
+
+def setup_autostart():
+    logging.debug("Copying autostart.lua to mpv script directory")
+    install_mpv_script('autostart.lua')
 
-    autoexit_source_path = os.path.join(
-        script_directory, 'aniskip', 'scripts', 'autoexit.lua')
-    autoexit_destination_path = os.path.join(
-        mpv_scripts_directory, 'autoexit.lua')
 
-    copy_file_if_different(autoexit_source_path, autoexit_destination_path)
+def setup_autoexit():
+    logging.debug("Copying autoexit.lua to mpv script directory")
+    install_mpv_script('autoexit.lua')
 
 
 if __name__ == '__main__':
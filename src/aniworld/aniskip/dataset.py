@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import logging
+import threading
+
+from aniworld.config import ANIME_DATASET_PATH, CACHE_DIRECTORY
+
+MAL_SOURCE_PATTERN = re.compile(r'myanimelist\.net/anime/(\d+)')
+SEASON_ORDER = {"WINTER": 0, "SPRING": 1, "SUMMER": 2, "FALL": 3}
+# bump when the layout of the persisted index changes
+INDEX_VERSION = 1
+INDEX_PATH = os.path.join(CACHE_DIRECTORY, "anime_dataset_index.json")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_title(title: str) -> str:
+    # titles and aniworld slugs end up in the same form,
+    # e.g. "Kaguya-sama: Love is War" and "kaguya-sama-love-is-war"
+    return " ".join(re.findall(r'[a-z0-9]+', title.lower()))
+
+
+def get_mal_id_from_sources(sources: list) -> int or None:
+    for source in sources:
+        match = MAL_SOURCE_PATTERN.search(source)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def build_index(dataset_path: str) -> dict:
+    with open(dataset_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)["data"]
+
+    titles = {}
+    anime = {}
+
+    for entry in entries:
+        mal_id = get_mal_id_from_sources(entry.get("sources", []))
+        if not mal_id:
+            continue
+
+        anime_season = entry.get("animeSeason") or {}
+        related = [
+            related_id for related_id in (
+                get_mal_id_from_sources([link]) for link in entry.get("relatedAnime", [])
+            ) if related_id
+        ]
+        anime[str(mal_id)] = {
+            "type": entry.get("type"),
+            "aired": [anime_season.get("year") or 0,
+                      SEASON_ORDER.get(anime_season.get("season"), 0)],
+            "related": related
+        }
+
+        for title in [entry.get("title", "")] + entry.get("synonyms", []):
+            key = normalize_title(title)
+            if key:
+                titles.setdefault(key, []).append(mal_id)
+
+    return {"titles": titles, "anime": anime}
+
+
+def get_dataset_signature(dataset_path: str) -> list or None:
+    try:
+        stat = os.stat(dataset_path)
+    except OSError:
+        return None
+    return [INDEX_VERSION, stat.st_mtime_ns, stat.st_size]
+
+
+def load_index(dataset_path: str = ANIME_DATASET_PATH) -> dict or None:
+    """
+    Returns the title and relation index of the offline dataset or None if
+    there is no dataset.
+
+    Parsing the full dataset takes a few seconds, so the much smaller index
+    is kept in the cache directory and only rebuilt when the dataset file
+    changes. After that it lives in memory for the rest of the process.
+    """
+
+    global _index  # pylint: disable=global-statement
+
+    with _index_lock:
+        if _index is not None:
+            return _index or None
+
+        signature = get_dataset_signature(dataset_path)
+        if signature is None:
+            logging.debug("No anime dataset found at %s", dataset_path)
+            _index = {}
+            return None
+
+        try:
+            with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get("signature") == signature:
+                _index = index
+                return _index
+        except (OSError, json.JSONDecodeError):
+            pass
+
+        logging.debug("Building anime dataset index from %s", dataset_path)
+        try:
+            index = build_index(dataset_path)
+        except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
+            logging.warning("Could not read anime dataset %s: %s", dataset_path, e)
+            _index = {}
+            return None
+
+        index["signature"] = signature
+        try:
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            temporary_path = f"{INDEX_PATH}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(temporary_path, INDEX_PATH)
+        except OSError as e:
+            logging.warning("Could not write anime dataset index: %s", e)
+
+        _index = index
+        return _index
+
+
+def find_sequel_id(anime_id: int) -> int or None:
+    index = load_index()
+    if not index:
+        return None
+
+    anime = index["anime"].get(str(anime_id))
+    if not anime:
+        return None
+
+    # the dataset doesn't name relations, the sequel is the
+    # first related TV entry that aired after this one
+    sequels = [
+        (index["anime"][str(related_id)]["aired"], related_id)
+        for related_id in anime["related"]
+        if str(related_id) in index["anime"]
+        and index["anime"][str(related_id)]["type"] == "TV"
+        and index["anime"][str(related_id)]["aired"] > anime["aired"]
+    ]
+    return min(sequels)[1] if sequels else None
+
+
+def find_mal_id(title: str, season: int = 1) -> int or None:
+    """
+    Looks up the MAL ID of a season in the offline dataset.
+
+    Example:
+        find_mal_id("Kaguya-sama: Love is War", 2)  # 40591
+
+    Returns None if there is no dataset or it doesn't know the title,
+    callers fall back to searching MyAnimeList then.
+    """
+
+    index = load_index()
+    if not index:
+        return None
+
+    candidates = index["titles"].get(normalize_title(title))
+    if not candidates:
+        return None
+
+    # prefer the earliest TV entry, synonyms are shared by movies and specials
+    def sort_key(mal_id):
+        anime = index["anime"][str(mal_id)]
+        return anime["type"] != "TV", anime["aired"]
+
+    anime_id = min(candidates, key=sort_key)
+
+    for _ in range(season - 1):
+        anime_id = find_sequel_id(anime_id)
+        if not anime_id:
+            return None
+
+    logging.debug("Found MAL ID %s for %s season %s in dataset", anime_id, title, season)
+    return anime_id
@@ -4,7 +4,9 @@ local mpv_options = require("mp.options")
 local options = {
     op_start = 0, op_end = 0, ed_start = 0, ed_end = 0,
 }
-mpv_options.read_options(options, "skip")
+-- a persistent mpv (--keep-watching) gets the skip times of every episode as
+-- per-file script-opts, the callback keeps the table in sync with them
+mpv_options.read_options(options, "skip", function() end)
 
 local function skip()
     local current_time = mp.get_property_number("time-pos")
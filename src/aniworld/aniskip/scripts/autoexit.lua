@@ -1,4 +1,12 @@
+local options = {
+    enabled = true,
+}
+-- disabled when aniworld keeps mpv open for the following episodes
+require("mp.options").read_options(options, "autoexit")
+
 function check_time()
+    if not options.enabled then return end
+
     local current_time = mp.get_property_number("time-pos")
     local total_time = mp.get_property_number("duration")
     
@@ -0,0 +1,269 @@
+import re
+import time
+import random
+import logging
+import threading
+from collections import Counter
+
+import requests
+from bs4 import BeautifulSoup
+
+from aniworld.common import JsonCache
+from aniworld.config import (
+    CATALOGUE_URL,
+    CATALOGUE_TTL,
+    GENRES_URL,
+    DEFAULT_REQUEST_TIMEOUT
+)
+
+# share of the query's trigrams a title needs to count as a match
+MIN_SIMILARITY = 0.3
+MAX_RESULTS = 50
+
+CATALOGUE_CACHE = JsonCache("catalogue")
+GENRE_CACHE = JsonCache("genres")
+
+_series = None
+_updated = 0
+_trigrams = {}
+_lock = threading.Lock()
+_refresh_thread = None
+_genre_refresh_thread = None
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r'\w+', text.lower()))
+
+
+def get_trigrams(text: str) -> set:
+    padded = f"  {normalize(text)} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def fetch_catalogue() -> list[dict]:
+    response = requests.get(CATALOGUE_URL, timeout=DEFAULT_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'html.parser')
+
+    series = []
+    seen = set()
+    for link in soup.find_all('a', href=re.compile(r'^/anime/stream/[^/]+/?$')):
+        slug = link['href'].rstrip('/').split('/')[-1]
+        if slug in seen:
+            continue
+        seen.add(slug)
+
+        alternatives = link.get('data-alternative-title') or ""
+        series.append({
+            "name": link.get_text(strip=True),
+            "link": slug,
+            "productionYear": None,
+            "alternatives": [title.strip() for title in alternatives.split(',') if title.strip()]
+        })
+
+    logging.debug("Fetched %d series from the catalogue", len(series))
+    return series
+
+
+def set_catalogue(series: list[dict], updated: float) -> None:
+    global _series, _updated, _trigrams  # pylint: disable=global-statement
+
+    trigrams = {}
+    for index, entry in enumerate(series):
+        for title in [entry["name"]] + entry["alternatives"]:
+            for trigram in get_trigrams(title):
+                trigrams.setdefault(trigram, set()).add(index)
+
+    with _lock:
+        _series, _updated, _trigrams = series, updated, trigrams
+
+
+def load_catalogue() -> bool:
+    if _series is not None:
+        return bool(_series)
+
+    cached = CATALOGUE_CACHE.get("series")
+    if cached:
+        set_catalogue(cached["series"], cached["updated"])
+    else:
+        set_catalogue([], 0)
+    return bool(_series)
+
+
+def refresh_catalogue() -> None:
+    try:
+        series = fetch_catalogue()
+    except requests.RequestException as e:
+        logging.warning("Could not refresh the series catalogue: %s", e)
+        return
+
+    if not series:
+        logging.warning("The series catalogue came back empty, keeping the old one")
+        return
+
+    # years are only known from ajax results, keep what was learned so far
+    years = {entry["link"]: entry["productionYear"] for entry in _series or []}
+    for entry in series:
+        entry["productionYear"] = years.get(entry["link"])
+
+    updated = time.time()
+    set_catalogue(series, updated)
+    CATALOGUE_CACHE.set("series", {"series": series, "updated": updated})
+
+
+def is_stale() -> bool:
+    return time.time() - _updated > CATALOGUE_TTL
+
+
+def refresh_in_background() -> None:
+    global _refresh_thread  # pylint: disable=global-statement
+
+    load_catalogue()
+    if not is_stale() or (_refresh_thread and _refresh_thread.is_alive()):
+        return
+
+    _refresh_thread = threading.Thread(
+        target=refresh_catalogue, name="catalogue", daemon=True)
+    _refresh_thread.start()
+
+
+def remember_years(results: list[dict]) -> None:
+    if not load_catalogue():
+        return
+
+    years = {
+        result.get("link"): result.get("productionYear")
+        for result in results if result.get("productionYear")
+    }
+    changed = False
+    for entry in _series:
+        year = years.get(entry["link"])
+        if year and entry["productionYear"] != year:
+            entry["productionYear"] = year
+            changed = True
+
+    if changed:
+        CATALOGUE_CACHE.set("series", {"series": _series, "updated": _updated})
+
+
+def search_catalogue(keyword: str, limit: int = MAX_RESULTS) -> list[dict] or None:
+    """
+    Searches the local copy of the series catalogue.
+
+    Example:
+        search_catalogue("kaguya sma")
+        # [{'name': 'Kaguya-sama: Love is War', 'link': 'kaguya-sama-love-is-war',
+        #   'productionYear': 2019, 'alternatives': [...]}]
+
+    Titles sharing the most trigrams with the query rank first, a title
+    containing the query as a whole ranks above any fuzzy match.
+    Returns None if there is no usable catalogue (missing or stale),
+    so callers know to ask aniworld.to instead.
+    """
+
+    if not load_catalogue() or is_stale():
+        return None
+
+    query = normalize(keyword)
+    query_trigrams = get_trigrams(keyword)
+    if not query:
+        return []
+
+    with _lock:
+        series, trigrams = _series, _trigrams
+
+    hits = Counter()
+    for trigram in query_trigrams:
+        hits.update(trigrams.get(trigram, ()))
+
+    ranked = []
+    for index, count in hits.items():
+        similarity = count / len(query_trigrams)
+        if similarity < MIN_SIMILARITY:
+            continue
+
+        entry = series[index]
+        titles = [normalize(title) for title in [entry["name"]] + entry["alternatives"]]
+        if any(title.startswith(query) for title in titles):
+            similarity += 2
+        elif any(query in title for title in titles):
+            similarity += 1
+        ranked.append((-similarity, len(entry["name"]), index))
+
+    return [series[index] for _, _, index in sorted(ranked)[:limit]]
+
+
+def fetch_genre_index() -> dict:
+    response = requests.get(GENRES_URL, timeout=DEFAULT_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'html.parser')
+
+    genres = {}
+    for section in soup.find_all('div', class_='genre'):
+        heading = section.find('h3')
+        if not heading:
+            continue
+        genres[heading.get_text(strip=True).lower()] = sorted({
+            link['href'].rstrip('/').split('/')[-1]
+            for link in section.find_all('a', href=re.compile(r'^/anime/stream/[^/]+/?$'))
+        })
+
+    logging.debug("Fetched %d genres", len(genres))
+    return genres
+
+
+def refresh_genre_index() -> dict or None:
+    try:
+        genres = fetch_genre_index()
+    except requests.RequestException as e:
+        logging.warning("Could not refresh the genre index: %s", e)
+        return None
+
+    if genres:
+        GENRE_CACHE.set("genres", {"genres": genres, "updated": time.time()})
+    return genres
+
+
+def get_genre_index() -> dict:
+    """
+    Returns the cached genre -> slugs index, e.g. {'drama': ['86-eighty-six', ...]}.
+
+    A cached index is returned right away even if it is old and refreshed
+    in a background thread for the next run. Only the very first call has
+    to wait for aniworld.to.
+    """
+
+    global _genre_refresh_thread  # pylint: disable=global-statement
+
+    cached = GENRE_CACHE.get("genres")
+    if not cached:
+        return refresh_genre_index() or {}
+
+    stale = time.time() - cached["updated"] > CATALOGUE_TTL
+    if stale and not (_genre_refresh_thread and _genre_refresh_thread.is_alive()):
+        _genre_refresh_thread = threading.Thread(
+            target=refresh_genre_index, name="genres", daemon=True)
+        _genre_refresh_thread.start()
+
+    return cached["genres"]
+
+
+def get_random_slug(genre: str = "all") -> str:
+    genre = genre.lower()
+
+    if genre == "all":
+        refresh_in_background()
+        if _series:
+            return random.choice(_series)["link"]
+
+    genres = get_genre_index()
+    if genre == "all":
+        slugs = sorted({slug for genre_slugs in genres.values() for slug in genre_slugs})
+    else:
+        slugs = genres.get(genre)
+
+    if not slugs:
+        available = ", ".join(sorted(genres)) or "none, could not reach aniworld.to"
+        raise ValueError(f"No anime found for genre '{genre}'. Available genres: {available}")
+
+    return random.choice(slugs)
@@ -1 +1,32 @@
-from .action import get_github_release, download_mpv, download_syncplay
+from aniworld.lazy import lazy_exports
+
+# name -> submodule, imported on first access so e.g. the cache doesn't pull in requests
+_EXPORTS = {
+    "get_github_release": ".action",
+    "download_mpv": ".action",
+    "download_syncplay": ".action",
+    "get_stream_info": ".stream",
+    "parse_header": ".stream",
+    "submit_verification": ".verify",
+    "wait_for_verifications": ".verify",
+    "open_event_stream": ".progress",
+    "run_with_progress_events": ".progress",
+    "emit_summary": ".progress",
+    "get_message_stream": ".progress",
+    "get_free_space": ".diskspace",
+    "format_size": ".diskspace",
+    "SpaceReservation": ".diskspace",
+    "JsonCache": ".cache",
+    "memoize": ".cache",
+    "MpvPlayer": ".mpv",
+    "get_ipc_path": ".mpv",
+    "HlsProxy": ".proxy",
+    "start_proxy": ".proxy",
+    "find_tool": ".tools",
+    "get_tool_version": ".tools",
+    "is_tool_installed": ".tools"
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(globals(), _EXPORTS)
@@ -7,7 +7,7 @@ import sys
 import os
 import re
 
-import requests
+from aniworld.common.tools import is_tool_installed
 
 # extremly unreliable lol
 
@@ -52,6 +52,8 @@ def check_avx2_support() -> bool:  # TODO Not working yet right
 
 
 def get_github_release(repo: str) -> dict:
+    import requests  # pylint: disable=import-outside-toplevel
+
     api_url = f"https://api.github.com/repos/{repo}/releases/latest"
 
     try:
@@ -66,6 +68,8 @@ def get_github_release(repo: str) -> dict:
 
 
 def download_7z(zip_tool: str) -> None:
+    import requests  # pylint: disable=import-outside-toplevel
+
     if not os.path.exists(zip_tool):
         print("Downloading 7z...")
         r = requests.get('https://7-zip.org/a/7zr.exe',
@@ -78,6 +82,13 @@ def download_mpv(dep_path: str = None, appdata_path: str = None, update: bool =
     if sys.platform != 'win32':
         return
 
+    # a validated cache entry means it is installed, no need to look at the disk again
+    if not update and is_tool_installed("mpv"):
+        return
+
+    # only needed on Windows, where mpv and syncplay are downloaded
+    import requests  # pylint: disable=import-outside-toplevel
+
     appdata_path = appdata_path or os.path.join(
         os.environ['USERPROFILE'], 'AppData', 'Roaming', 'aniworld'
     )
@@ -153,6 +164,13 @@ def download_syncplay(dep_path: str = None, appdata_path: str = None, update: bo
     if sys.platform != 'win32':
         return
 
+    # a validated cache entry means it is installed, no need to look at the disk again
+    if not update and is_tool_installed("syncplay"):
+        return
+
+    # only needed on Windows, where mpv and syncplay are downloaded
+    import requests  # pylint: disable=import-outside-toplevel
+
     appdata_path = appdata_path or os.path.join(
         os.environ['USERPROFILE'], 'AppData', 'Roaming', 'aniworld')
     dep_path = dep_path or os.path.join(appdata_path, "syncplay")
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import collections
+
+from aniworld.config import CACHE_DIRECTORY
+
+
+class JsonCache:
+    """
+    A small persistent key/value store kept as a JSON file in CACHE_DIRECTORY.
+
+    Example:
+        mal_ids = JsonCache("mal_ids")
+        mal_ids.set("kaguya-sama: love is war|1", 37999)
+        mal_ids.get("kaguya-sama: love is war|1")  # 37999
+
+    The file is read on first access and rewritten atomically on every set,
+    so values survive restarts. Entries older than ttl seconds, or the ttl
+    set() was given for them, are ignored.
+    Threads of one process share the in-memory copy, concurrent processes
+    simply overwrite each other which is fine for caches.
+    """
+
+    def __init__(self, name: str, ttl: float = None) -> None:
+        self.path = os.path.join(CACHE_DIRECTORY, f"{name}.json")
+        self.ttl = ttl
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._data = {}
+            except OSError as e:
+                logging.warning("Could not read cache %s: %s", self.path, e)
+                self._data = {}
+        return self._data
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.warning("Could not write cache %s: %s", self.path, e)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._load().get(key)
+
+        if entry is None:
+            return default
+        ttl = entry.get("ttl", self.ttl)
+        if ttl is not None and time.time() - entry["time"] > ttl:
+            return default
+        return entry["value"]
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        entry = {"value": value, "time": time.time()}
+        if ttl is not None:
+            entry["ttl"] = ttl
+
+        with self._lock:
+            self._load()[key] = entry
+            self._save()
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+def memoize(maxsize: int = 128, ttl: float = None, cacheable=None):
+    """
+    Like functools.lru_cache, but results expire after ttl seconds and
+    results for which cacheable(result) is false aren't kept.
+
+    Example:
+        @memoize(ttl=600, cacheable=lambda response: response.ok)
+        def get_series_html(slug: str) -> requests.models.Response: ...
+
+    Exceptions are never cached, cache_clear() empties the cache.
+    """
+
+    def decorator(function):
+        entries = collections.OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            with lock:
+                entry = entries.get(key)
+                if entry and (ttl is None or time.monotonic() - entry[0] <= ttl):
+                    entries.move_to_end(key)
+                    return entry[1]
+
+            result = function(*args, **kwargs)
+            if cacheable is None or cacheable(result):
+                with lock:
+                    entries[key] = (time.monotonic(), result)
+                    entries.move_to_end(key)
+                    while len(entries) > maxsize:
+                        entries.popitem(last=False)
+            return result
+
+        def cache_clear() -> None:
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,68 @@
+import os
+import shutil
+import logging
+
+from aniworld.config import RESERVATION_FILE_NAME
+
+
+def get_free_space(path: str) -> int:
+    # the output directory may not exist yet, ask the closest existing parent
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class SpaceReservation:
+    """
+    Holds disk space for a batch of downloads in a preallocated file.
+
+    yt-dlp creates and resumes its own output files, so they can't be
+    preallocated in place. Instead the space of the whole batch is
+    allocated up front and handed back right before each episode starts,
+    which keeps other writers from filling the volume in the meantime and
+    leaves large contiguous free extents for the next file.
+
+    Example:
+        reservation = SpaceReservation("/mnt/nas/Anime", 3 * 500 * 1024**2)
+        reservation.shrink(2 * 500 * 1024**2)  # before episode 1
+        reservation.release()
+    """
+
+    def __init__(self, directory: str, size: int) -> None:
+        self.path = os.path.join(directory, RESERVATION_FILE_NAME)
+        self.size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'wb') as f:
+            if size <= 0:
+                pass
+            elif hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, size)
+                    self.size = size
+                except OSError as e:
+                    logging.warning("Could not preallocate %s: %s", self.path, e)
+            else:
+                logging.debug("posix_fallocate is not available on this platform")
+
+    def shrink(self, size: int) -> None:
+        if size < self.size:
+            os.truncate(self.path, max(size, 0))
+            self.size = max(size, 0)
+
+    def release(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import tempfile
+import itertools
+import subprocess
+import collections
+
+from aniworld.config import MPV_IPC_CONNECT_TIMEOUT
+
+_ipc_counter = itertools.count()
+
+
+def get_ipc_path() -> str:
+    # unique per player, a new mpv must not be mistaken for the previous one
+    name = f"aniworld-mpv-{os.getpid()}-{next(_ipc_counter)}"
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{name}"
+    return os.path.join(tempfile.gettempdir(), f"{name}.sock")
+
+
+class MpvPlayer:
+    """
+    A single mpv process controlled over its JSON IPC.
+
+    Example:
+        player = MpvPlayer(MPV_PATH, ["--fs"])
+        player.append(direct_link, {"force-media-title": "Episode 1"})
+        player.wait_until_idle()
+        player.quit()
+
+    mpv starts idle and keeps running between playlist entries, so files
+    appended while one is playing start without a new player window.
+    Commands and events share one connection and must be used from a
+    single thread, another thread can follow the same mpv through its own
+    MpvPlayer(ipc_path=player.ipc_path). Once mpv is closed, e.g. by the
+    user, `closed` is set and the methods return None.
+    """
+
+    def __init__(self, mpv_path: str = None, arguments: list = None, ipc_path: str = None) -> None:
+        # without mpv_path, connects to an mpv that already listens on ipc_path
+        self.ipc_path = ipc_path or get_ipc_path()
+        self.closed = False
+        self.process = None
+        self._request_id = 0
+        self._events = collections.deque()
+
+        if mpv_path is None:
+            self._connection = self._connect()
+            return
+
+        command = [
+            mpv_path,
+            "--idle=yes",
+            f"--input-ipc-server={self.ipc_path}",
+            *(arguments or [])
+        ]
+        logging.debug("Executing command:\n%s", command)
+        self.process = subprocess.Popen(command)  # pylint: disable=consider-using-with
+
+        try:
+            self._connection = self._connect()
+        except OSError:
+            self.process.kill()
+            raise
+
+    def _connect(self):  # pylint: disable=consider-using-with
+        # mpv creates the socket shortly after it started
+        deadline = time.monotonic() + MPV_IPC_CONNECT_TIMEOUT
+        while True:
+            try:
+                if sys.platform == "win32":
+                    return open(self.ipc_path, 'r+b', buffering=0)
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    connection.connect(self.ipc_path)
+                except OSError:
+                    connection.close()
+                    raise
+                return connection.makefile('rwb')
+            except OSError:
+                exited = self.process is not None and self.process.poll() is not None
+                if exited or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _send(self, message: dict) -> bool:
+        try:
+            self._connection.write(json.dumps(message).encode("utf-8") + b"\n")
+            self._connection.flush()
+            return True
+        except OSError:
+            self.closed = True
+            return False
+
+    def _receive(self) -> dict or None:
+        while not self.closed:
+            try:
+                line = self._connection.readline()
+            except OSError:
+                line = b""
+
+            if not line:
+                self.closed = True
+                break
+
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                logging.debug("Invalid mpv IPC message: %r", line)
+        return None
+
+    def command(self, *arguments, **named_arguments) -> dict or None:
+        """
+        Sends a command and returns mpv's response. Named arguments are
+        sent in mpv's named form, e.g. command("loadfile", url=link).
+        Events that arrive in the meantime are kept for wait_for_event().
+        """
+
+        self._request_id += 1
+        if named_arguments:
+            command = {"name": arguments[0], **named_arguments}
+        else:
+            command = list(arguments)
+
+        if not self._send({"command": command, "request_id": self._request_id}):
+            return None
+
+        while True:
+            message = self._receive()
+            if message is None:
+                return None
+            if "event" in message:
+                self._events.append(message)
+            elif message.get("request_id") == self._request_id:
+                # e.g. "path" is unavailable while mpv is idle, callers get None
+                if message.get("error") not in ("success", "property unavailable"):
+                    logging.warning("mpv could not run %s: %s", command, message.get("error"))
+                return message
+
+    def wait_for_event(self, *names: str) -> dict or None:
+        while True:
+            event = self._events.popleft() if self._events else self._receive()
+            if event is None:
+                return None
+            if event.get("event") in names:
+                return event
+
+    def get_property(self, name: str):
+        response = self.command("get_property", name)
+        return response.get("data") if response else None
+
+    def append(self, url: str, options: dict = None) -> dict or None:
+        # starts playing right away if mpv is idle
+        return self.command("loadfile", url=url, flags="append-play", options=options or {})
+
+    def wait_until_playing_last(self) -> None:
+        # returns once the last entry of the playlist started, failed or mpv was closed
+        while not self.closed:
+            if self.get_property("idle-active"):
+                return
+            position = self.get_property("playlist-pos")
+            count = self.get_property("playlist-count")
+            if position is not None and count is not None and position == count - 1:
+                return
+            self.wait_for_event("start-file", "end-file")
+
+    def wait_until_playing(self, path: str) -> bool:
+        """
+        Waits until the file at path started playing. Returns False if mpv
+        moved on to another file before that or was closed.
+        """
+
+        loading = False
+        while not self.closed:
+            if self.get_property("path") == path:
+                loading = True
+                if self.get_property("core-idle") is False:
+                    return True
+            elif loading:
+                return False
+            self.wait_for_event("start-file", "playback-restart")
+        return False
+
+    def wait_until_idle(self) -> None:
+        # returns once the playlist ran out or mpv was closed
+        self.command("observe_property", 1, "idle-active")
+        while not self.closed:
+            event = self.wait_for_event("property-change")
+            if event and event.get("name") == "idle-active" and event.get("data"):
+                return
+
+    def quit(self) -> None:
+        if not self.closed:
+            self.command("quit")
+        self.close()
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self._connection.close()
+        except OSError:
+            pass
+        if self.process is None:
+            return
+
+        try:
+            self.process.wait(timeout=MPV_IPC_CONNECT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+        if sys.platform != "win32":
+            try:
+                os.remove(self.ipc_path)
+            except OSError:
+                pass
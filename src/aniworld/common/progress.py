@@ -0,0 +1,169 @@
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+
+# prefix of the lines yt-dlp prints through --progress-template
+PROGRESS_MARKER = "[aniworld-progress] "
+PROGRESS_TEMPLATE = f"download:{PROGRESS_MARKER}%(progress)j"
+# seconds between two progress events of the same download
+PROGRESS_EVENT_INTERVAL = 0.5
+
+_stream = None
+_stream_path = None
+_lock = threading.Lock()
+_provider_stats = {}
+
+
+def open_event_stream(path: str) -> None:
+    global _stream, _stream_path  # pylint: disable=global-statement
+
+    if _stream is not None and path == _stream_path:
+        return
+
+    if path == "-":
+        _stream = sys.stdout
+    else:
+        _stream = open(path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+    _stream_path = path
+
+
+def get_message_stream():
+    # human readable output would break the JSON lines of "--progress-events -"
+    return sys.stderr if _stream is sys.stdout else sys.stdout
+
+
+def emit_event(event: str, **fields) -> None:
+    if _stream is None:
+        return
+
+    line = json.dumps({"event": event, "time": time.time(), **fields})
+    with _lock:
+        _stream.write(line + "\n")
+        _stream.flush()
+
+
+def record_download(provider: str, downloaded_bytes: int, seconds: float, success: bool) -> None:
+    with _lock:
+        stats = _provider_stats.setdefault(
+            provider, {"episodes": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+        )
+        stats["episodes"] += 1
+        stats["failed"] += 0 if success else 1
+        stats["bytes"] += downloaded_bytes or 0
+        stats["seconds"] += seconds
+
+
+def emit_summary() -> None:
+    providers = {
+        provider: {
+            **stats,
+            "rate": stats["bytes"] / stats["seconds"] if stats["seconds"] else None
+        }
+        for provider, stats in _provider_stats.items()
+    }
+    emit_event("summary", providers=providers)
+
+
+def print_progress_line(progress: dict) -> None:
+    downloaded = progress.get("downloaded_bytes") or 0
+    total = progress.get("total_bytes") or progress.get("total_bytes_estimate")
+    speed = progress.get("speed")
+    eta = progress.get("eta")
+
+    percent = f"{downloaded / total * 100:5.1f}%" if total else "  ?  %"
+    rate = f"{speed / 1024 / 1024:6.2f} MiB/s" if speed else "   ? MiB/s"
+    remaining = f"ETA {int(eta)}s" if eta is not None else ""
+    print(f"\r{percent} {rate} {remaining:<12}", end="", flush=True)
+
+
+def run_with_progress_events(command: list, **context) -> None:
+    """
+    Runs yt-dlp and turns its output into JSON line events.
+
+    The context (e.g. provider, season, episode) is added to every event.
+    Fragment retries are counted from yt-dlp's "Retrying fragment" messages.
+    Raises subprocess.CalledProcessError like subprocess.run(check=True).
+    """
+
+    command = [item for item in command if item != "--quiet"]
+    command += ["--newline", "--progress-template", PROGRESS_TEMPLATE]
+    logging.debug("Executing command:\n%s", command)
+
+    # a human readable line is only useful if the events go somewhere else
+    show_progress = _stream is not sys.stdout
+    start_time = time.monotonic()
+    last_event_time = 0
+    fragment_retries = 0
+    progress = {}
+
+    emit_event("start", **context)
+
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace"
+    ) as process:
+        for line in process.stdout:
+            line = line.strip()
+
+            if line.startswith(PROGRESS_MARKER):
+                try:
+                    progress = json.loads(line[len(PROGRESS_MARKER):])
+                except json.JSONDecodeError:
+                    continue
+
+                now = time.monotonic()
+                if (now - last_event_time < PROGRESS_EVENT_INTERVAL
+                        and progress.get("status") == "downloading"):
+                    continue
+                last_event_time = now
+
+                emit_event(
+                    "progress",
+                    **context,
+                    status=progress.get("status"),
+                    bytes=progress.get("downloaded_bytes"),
+                    total_bytes=(progress.get("total_bytes")
+                                 or progress.get("total_bytes_estimate")),
+                    rate=progress.get("speed"),
+                    eta=progress.get("eta"),
+                    fragment_index=progress.get("fragment_index"),
+                    fragment_count=progress.get("fragment_count"),
+                    fragment_retries=fragment_retries
+                )
+                if show_progress:
+                    print_progress_line(progress)
+            elif "Retrying fragment" in line:
+                fragment_retries += 1
+                emit_event("retry", **context, message=line,
+                           fragment_retries=fragment_retries)
+            elif line.startswith("ERROR:"):
+                print(line, file=sys.stderr)
+            else:
+                logging.debug("yt-dlp: %s", line)
+
+    if show_progress:
+        print()
+
+    elapsed = time.monotonic() - start_time
+    downloaded_bytes = progress.get("downloaded_bytes") or progress.get("total_bytes")
+    success = process.returncode == 0
+
+    record_download(context.get("provider"), downloaded_bytes, elapsed, success)
+    emit_event(
+        "finish",
+        **context,
+        status="ok" if success else "error",
+        bytes=downloaded_bytes,
+        elapsed=elapsed,
+        rate=downloaded_bytes / elapsed if downloaded_bytes and elapsed else None,
+        fragment_retries=fragment_retries
+    )
+
+    if not success:
+        raise subprocess.CalledProcessError(process.returncode, command)
@@ -0,0 +1,303 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import http.server
+import concurrent.futures
+from urllib.parse import urljoin
+
+import requests
+
+from aniworld.config import (
+    DEFAULT_REQUEST_TIMEOUT,
+    PROXY_READAHEAD_SEGMENTS,
+    PROXY_WORKERS,
+    RANDOM_USER_AGENT
+)
+from aniworld.common.stream import STREAM_INF_PATTERN, is_hls_link, parse_header
+
+PROXY_CHUNK_SIZE = 64 * 1024
+
+
+class ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+    proxy = None
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        try:
+            if self.path == "/playlist.m3u8":
+                body = self.proxy.playlist.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path.startswith("/resource/") and self.path[10:].isdigit():
+                self.send_resource(int(self.path[10:]))
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            # the player closed the connection, e.g. after a seek
+            pass
+
+    def send_resource(self, index: int) -> None:
+        if index >= len(self.proxy.resources):
+            self.send_error(404)
+            return
+
+        try:
+            path = self.proxy.get_resource(index)
+        except (requests.RequestException, OSError) as e:
+            logging.warning("Could not fetch %s: %s", self.proxy.resources[index], e)
+            self.send_error(502)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, PROXY_CHUNK_SIZE)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug("Proxy: " + format, *args)
+
+
+class HlsProxy:
+    """
+    Serves an HLS stream to a local player and downloads its segments ahead
+    of the playhead.
+
+    Example:
+        proxy = HlsProxy(direct_link, 'Referer: "https://vidmoly.to"')
+        subprocess.run([MPV_PATH, proxy.url])
+        proxy.close(persist_path="~/Downloads/Episode 1.mp4")
+
+    The media playlist is rewritten to point at the proxy. Every segment
+    the player asks for, and the next PROXY_READAHEAD_SEGMENTS after it,
+    are downloaded into a disk cache, so hoster stalls are bridged and
+    seeking back is served locally. Memory use is bounded by the segments
+    in flight. Readahead that a seek made obsolete is cancelled.
+
+    Raises ValueError for playlists that can't be proxied (live streams or
+    separate audio renditions), callers play the direct link instead.
+    """
+
+    def __init__(
+        self,
+        direct_link: str,
+        header: str = None,
+        readahead: int = PROXY_READAHEAD_SEGMENTS,
+        workers: int = PROXY_WORKERS
+    ) -> None:
+        self.readahead = readahead
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': RANDOM_USER_AGENT, **parse_header(header)})
+
+        # absolute upstream URLs of everything the playlist references
+        self.resources = []
+        # positions of the media segments in self.resources, in playback order
+        self.segments = []
+        self._segment_positions = {}
+        self.init_segment = None
+        self.encrypted = False
+        self.last_position = -1
+        self.playlist = self._load_playlist(direct_link)
+
+        self.cache_directory = tempfile.mkdtemp(prefix="aniworld-proxy-")
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="proxy")
+
+        handler = type("HlsProxyRequestHandler", (ProxyRequestHandler,), {"proxy": self})
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="proxy-server", daemon=True).start()
+
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/playlist.m3u8"
+        logging.debug("Proxying %s at %s", direct_link, self.url)
+
+    def _get_text(self, url: str) -> str:
+        response = self.session.get(url, timeout=DEFAULT_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.text
+
+    def _load_playlist(self, playlist_url: str) -> str:
+        playlist = self._get_text(playlist_url)
+        lines = playlist.splitlines()
+
+        # master playlist, follow the variant with the highest bandwidth
+        variants = []
+        for index, line in enumerate(lines):
+            if line.startswith("#EXT-X-MEDIA:") and "URI=" in line:
+                raise ValueError("playlists with separate renditions are not supported")
+            match = STREAM_INF_PATTERN.match(line)
+            if match and index + 1 < len(lines):
+                variants.append((int(match.group(1)), lines[index + 1].strip()))
+
+        if variants:
+            playlist_url = urljoin(playlist_url, max(variants)[1])
+            playlist = self._get_text(playlist_url)
+            lines = playlist.splitlines()
+
+        if "#EXT-X-ENDLIST" not in playlist:
+            raise ValueError("live playlists are not supported")
+
+        rewritten = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(("#EXT-X-KEY:", "#EXT-X-MAP:")) and 'URI="' in line:
+                prefix, _, rest = line.partition('URI="')
+                uri, _, suffix = rest.partition('"')
+                if line.startswith("#EXT-X-KEY:"):
+                    self.encrypted = self.encrypted or "METHOD=NONE" not in line
+                elif self.init_segment is None:
+                    self.init_segment = len(self.resources)
+                line = f'{prefix}URI="/resource/{len(self.resources)}"{suffix}'
+                self.resources.append(urljoin(playlist_url, uri))
+            elif line and not line.startswith("#"):
+                self._segment_positions[len(self.resources)] = len(self.segments)
+                self.segments.append(len(self.resources))
+                self.resources.append(urljoin(playlist_url, line))
+                line = f"/resource/{self.segments[-1]}"
+            rewritten.append(line)
+
+        return "\n".join(rewritten) + "\n"
+
+    def _fetch(self, index: int) -> str:
+        path = os.path.join(self.cache_directory, str(index))
+        if os.path.exists(path):
+            return path
+
+        # the player and the readahead may ask for the same segment at once
+        temporary_path = f"{path}.{threading.get_ident()}.part"
+        with self.session.get(
+            self.resources[index], stream=True, timeout=DEFAULT_REQUEST_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            with open(temporary_path, 'wb') as f:
+                for chunk in response.iter_content(PROXY_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(temporary_path, path)
+        return path
+
+    def _submit(self, index: int) -> concurrent.futures.Future:
+        # must be called with the lock held
+        future = self._futures.get(index)
+        if future is None or future.cancelled() or (future.done() and future.exception()):
+            future = self._futures[index] = self._executor.submit(self._fetch, index)
+        return future
+
+    def _read_ahead(self, position: int) -> None:
+        window = set(self.segments[position + 1:position + 1 + self.readahead])
+        with self._lock:
+            # a seek leaves the old readahead behind, drop what didn't start yet
+            for index, future in list(self._futures.items()):
+                if (index in self._segment_positions and index not in window
+                        and future.cancel()):
+                    del self._futures[index]
+            for index in sorted(window):
+                self._submit(index)
+
+    def get_resource(self, index: int) -> str:
+        """
+        Returns the path of a cached resource, downloading it in the
+        calling thread if no download is running yet.
+        """
+
+        position = self._segment_positions.get(index)
+        if position is not None:
+            self.last_position = max(self.last_position, position)
+            self._read_ahead(position)
+
+        with self._lock:
+            future = self._futures.get(index)
+            running = future is not None and not future.cancelled() and not (
+                future.done() and future.exception())
+
+        if running:
+            return future.result()
+
+        path = self._fetch(index)
+        with self._lock:
+            self._futures[index] = concurrent.futures.Future()
+            self._futures[index].set_result(path)
+        return path
+
+    def persist(self, output_path: str) -> str or None:
+        """
+        Writes the whole episode to output_path once playback reached its
+        last segment, downloading the segments that were skipped. The
+        segments are remuxed with ffmpeg if it is installed, otherwise they
+        are kept as a .ts file next to output_path. Returns the written path.
+        """
+
+        if self.encrypted:
+            logging.warning("Not keeping %s, the stream is encrypted", output_path)
+            return None
+        if self.last_position < len(self.segments) - 1:
+            logging.debug("Not keeping %s, playback didn't reach the end", output_path)
+            return None
+
+        with self._lock:
+            futures = [self._submit(index) for index in self.segments]
+        try:
+            paths = [future.result() for future in futures]
+            if self.init_segment is not None:
+                paths.insert(0, self.get_resource(self.init_segment))
+        except (requests.RequestException, OSError) as e:
+            logging.warning("Could not keep %s: %s", output_path, e)
+            return None
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        stream_path = os.path.splitext(output_path)[0] + ".ts"
+        with open(stream_path, 'wb') as output:
+            for path in paths:
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, output)
+
+        ffmpeg_path = shutil.which("ffmpeg")
+        if not ffmpeg_path:
+            return stream_path
+
+        try:
+            subprocess.run(
+                [ffmpeg_path, "-v", "error", "-y", "-i", stream_path, "-c", "copy", output_path],
+                check=True
+            )
+        except (subprocess.CalledProcessError, OSError) as e:
+            logging.warning("Could not remux %s: %s", stream_path, e)
+            return stream_path
+
+        os.remove(stream_path)
+        return output_path
+
+    def close(self, persist_path: str = None) -> str or None:
+        """
+        Stops the proxy and removes its segments. With persist_path, the
+        episode is kept first, see persist(), and the written path returned.
+        """
+
+        path = self.persist(persist_path) if persist_path else None
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        return path
+
+
+def start_proxy(direct_link: str, header: str = None) -> HlsProxy or None:
+    # only HLS streams are proxied, mpv buffers plain files well on its own
+    if not is_hls_link(direct_link):
+        return None
+
+    try:
+        return HlsProxy(direct_link, header)
+    except (requests.RequestException, ValueError, OSError) as e:
+        logging.warning("Playing %s without the proxy: %s", direct_link, e)
+        return None
@@ -0,0 +1,89 @@
+import re
+import logging
+from urllib.parse import urljoin
+
+import requests
+
+from aniworld.config import DEFAULT_REQUEST_TIMEOUT, RANDOM_USER_AGENT
+
+STREAM_INF_PATTERN = re.compile(r'#EXT-X-STREAM-INF:.*?BANDWIDTH=(\d+)')
+EXTINF_PATTERN = re.compile(r'#EXTINF:([\d.]+)')
+
+
+def parse_header(header: str) -> dict:
+    # PROVIDER_HEADERS are yt-dlp style, e.g. 'Referer: "https://vidmoly.to"'
+    if not header:
+        return {}
+    name, _, value = header.partition(":")
+    return {name.strip(): value.strip().strip('"')}
+
+
+def is_hls_link(direct_link: str) -> bool:
+    return ".m3u8" in direct_link.split("?")[0]
+
+
+def get_hls_info(playlist_url: str, headers: dict) -> dict:
+    response = requests.get(
+        playlist_url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    playlist = response.text
+    bandwidth = None
+
+    # master playlist, follow the variant with the highest bandwidth
+    variants = []
+    lines = playlist.splitlines()
+    for index, line in enumerate(lines):
+        match = STREAM_INF_PATTERN.match(line)
+        if match and index + 1 < len(lines):
+            variants.append((int(match.group(1)), lines[index + 1].strip()))
+
+    if variants:
+        bandwidth, variant_uri = max(variants)
+        playlist_url = urljoin(playlist_url, variant_uri)
+        response = requests.get(
+            playlist_url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        playlist = response.text
+
+    duration = sum(float(value) for value in EXTINF_PATTERN.findall(playlist))
+
+    return {
+        "duration": duration or None,
+        "bandwidth": bandwidth,
+        # bits per second times seconds
+        "size": int(bandwidth * duration / 8) if bandwidth and duration else None
+    }
+
+
+def get_stream_info(direct_link: str, header: str = None) -> dict:
+    """
+    Returns what can be known about a stream before downloading it.
+
+    Example:
+        {'duration': 1420.5, 'bandwidth': 2500000, 'size': 443906250}
+
+    HLS playlists provide the duration (and an estimated size if the master
+    playlist advertises a bandwidth), plain files only their Content-Length.
+    Unknown values are None.
+    """
+
+    headers = {'User-Agent': RANDOM_USER_AGENT, **parse_header(header)}
+    info = {"duration": None, "bandwidth": None, "size": None}
+
+    try:
+        if is_hls_link(direct_link):
+            return get_hls_info(direct_link, headers)
+
+        response = requests.head(
+            direct_link,
+            headers=headers,
+            allow_redirects=True,
+            timeout=DEFAULT_REQUEST_TIMEOUT
+        )
+        content_length = response.headers.get("Content-Length")
+        if response.ok and content_length and content_length.isdigit():
+            info["size"] = int(content_length)
+    except requests.RequestException as e:
+        logging.warning("Could not fetch stream info for %s: %s", direct_link, e)
+
+    return info
@@ -0,0 +1,133 @@
+import os
+import re
+import shutil
+import logging
+import platform
+import subprocess
+
+from aniworld.common.cache import JsonCache
+
+TOOL_VERSION_PATTERN = re.compile(r'(\d+(?:\.\d+)+)')
+TOOL_VERSION_TIMEOUT = 10
+
+TOOLS_CACHE = JsonCache("tools")
+
+
+def locate_mpv() -> str or None:
+    mpv_path = shutil.which("mpv")
+    if not mpv_path and platform.system() == "Windows":
+        mpv_path = os.path.join(os.getenv('APPDATA', ''),
+                                "aniworld", "mpv", "mpv.exe")
+    return mpv_path
+
+
+def locate_syncplay() -> str or None:
+    syncplay_path = shutil.which("syncplay")
+    if platform.system() == "Windows":
+        if syncplay_path:
+            syncplay_path = syncplay_path.replace(
+                "syncplay.EXE", "SyncplayConsole.exe")
+        else:
+            syncplay_path = os.path.join(
+                os.getenv(
+                    'APPDATA', ''), "aniworld", "syncplay", "SyncplayConsole.exe"
+            )
+    return syncplay_path
+
+
+def locate_ytdlp() -> str or None:
+    return shutil.which("yt-dlp")  # already in pip deps
+
+
+TOOL_LOCATORS = {
+    "mpv": locate_mpv,
+    "syncplay": locate_syncplay,
+    "yt-dlp": locate_ytdlp
+}
+
+
+def get_cached_tool(name: str) -> dict or None:
+    # an entry is valid as long as PATH is unchanged and the file wasn't replaced
+    entry = TOOLS_CACHE.get(name)
+    if not entry or entry["search_path"] != os.environ.get("PATH", ""):
+        return None
+
+    try:
+        stat = os.stat(entry["path"])
+    except OSError:
+        return None
+
+    if stat.st_mtime_ns != entry["mtime"] or stat.st_size != entry["size"]:
+        return None
+    return entry
+
+
+def find_tool(name: str) -> str or None:
+    """
+    Returns the path of an external tool, e.g. find_tool("mpv").
+
+    Searching PATH can be slow with network mounted directories, so the
+    result is kept in the tools cache and reused while PATH is the same
+    and the executable has the same mtime and size. Tools that aren't
+    installed (yet) are searched again on every call.
+    """
+
+    entry = get_cached_tool(name)
+    if entry:
+        return entry["path"]
+
+    path = TOOL_LOCATORS[name]()
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+
+    if stat:
+        TOOLS_CACHE.set(name, {
+            "path": path,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "search_path": os.environ.get("PATH", "")
+        })
+    logging.debug("Found %s at %s", name, path)
+    return path
+
+
+def is_tool_installed(name: str) -> bool:
+    # find_tool only caches executables that exist
+    return bool(find_tool(name)) and get_cached_tool(name) is not None
+
+
+def get_tool_version(name: str) -> tuple[int, ...] or None:
+    """
+    Returns the version of an installed tool as a tuple, e.g. (0, 38, 0)
+    for "mpv v0.38.0-dirty", or None if it is unknown.
+
+    The version is only asked for when a caller needs it and stays cached
+    until the executable changes.
+    """
+
+    path = find_tool(name)
+    entry = get_cached_tool(name)
+    if entry is None:
+        return None
+    if "version" in entry:
+        return tuple(entry["version"]) if entry["version"] else None
+
+    try:
+        result = subprocess.run(
+            [path, "--version"],
+            capture_output=True,
+            text=True,
+            errors="replace",
+            timeout=TOOL_VERSION_TIMEOUT,
+            check=False
+        )
+        match = TOOL_VERSION_PATTERN.search(result.stdout or result.stderr)
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.warning("Could not get the version of %s: %s", name, e)
+        return None
+
+    version = [int(part) for part in match.group(1).split(".")] if match else None
+    TOOLS_CACHE.set(name, {**entry, "version": version})
+    return tuple(version) if version else None
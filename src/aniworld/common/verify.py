@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+import concurrent.futures
+
+from aniworld.config import (
+    DEFAULT_VERIFY_WORKERS,
+    MANIFEST_FILE_NAME,
+    VERIFY_DURATION_TOLERANCE
+)
+from aniworld.common.progress import get_message_stream
+from aniworld.common.stream import get_stream_info
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_executor = None
+_futures = set()
+_manifest_lock = threading.Lock()
+
+
+def hash_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_container_duration(file_path: str) -> float or None:
+    ffprobe_path = shutil.which("ffprobe")
+    if not ffprobe_path:
+        return None
+
+    try:
+        result = subprocess.run(
+            [
+                ffprobe_path, "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                file_path
+            ],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError, OSError) as e:
+        logging.warning("ffprobe could not read %s: %s", file_path, e)
+        return None
+
+
+def write_manifest_entry(file_path: str, entry: dict) -> None:
+    manifest_path = os.path.join(os.path.dirname(file_path), MANIFEST_FILE_NAME)
+
+    with _manifest_lock:
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+
+        manifest[os.path.basename(file_path)] = entry
+
+        temporary_path = f"{manifest_path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temporary_path, manifest_path)
+
+
+def verify_download(file_path: str, direct_link: str, header: str = None) -> dict:
+    """
+    Checks a finished download against what the hoster advertised and
+    records the result in the manifest next to the file.
+
+    A file is considered broken if it is missing, its size differs from the
+    Content-Length, or its container duration (via ffprobe) is shorter than
+    the HLS playlist. Checks that can't be made are skipped.
+    """
+
+    entry = {
+        "status": "ok",
+        "checked_at": time.time(),
+        "sha256": None,
+        "size": None,
+        "expected_size": None,
+        "duration": None,
+        "expected_duration": None,
+        "reason": None
+    }
+
+    if not os.path.exists(file_path):
+        entry.update(status="failed", reason="file is missing")
+        write_manifest_entry(file_path, entry)
+        return entry
+
+    expected = get_stream_info(direct_link, header)
+    entry["size"] = os.path.getsize(file_path)
+    entry["sha256"] = hash_file(file_path)
+    entry["duration"] = get_container_duration(file_path)
+    entry["expected_duration"] = expected["duration"]
+
+    # the estimated size of HLS streams is no exact reference
+    if not expected["bandwidth"]:
+        entry["expected_size"] = expected["size"]
+
+    if entry["expected_size"] and entry["size"] != entry["expected_size"]:
+        entry.update(
+            status="failed",
+            reason=f"size {entry['size']} != Content-Length {entry['expected_size']}"
+        )
+    elif entry["duration"] and entry["expected_duration"]:
+        missing = entry["expected_duration"] - entry["duration"]
+        if missing > entry["expected_duration"] * VERIFY_DURATION_TOLERANCE:
+            entry.update(
+                status="failed",
+                reason=f"duration {entry['duration']:.1f}s < playlist "
+                       f"{entry['expected_duration']:.1f}s"
+            )
+    elif not entry["expected_size"]:
+        entry["status"] = "unverified"
+
+    write_manifest_entry(file_path, entry)
+    logging.debug("Verified %s: %s", file_path, entry)
+    return entry
+
+
+def submit_verification(
+    file_path: str,
+    direct_link: str,
+    header: str = None,
+    on_failure=None,
+    on_success=None
+) -> concurrent.futures.Future:
+    global _executor  # pylint: disable=global-statement
+
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=DEFAULT_VERIFY_WORKERS,
+            thread_name_prefix="verify"
+        )
+
+    def task():
+        entry = verify_download(file_path, direct_link, header)
+        if entry["status"] == "failed":
+            print(
+                f"Verification failed for {file_path}: {entry['reason']}",
+                file=get_message_stream()
+            )
+            if on_failure:
+                on_failure(entry)
+        elif on_success:
+            on_success(entry)
+        return entry
+
+    future = _executor.submit(task)
+    _futures.add(future)
+    future.add_done_callback(_futures.discard)
+    return future
+
+
+def wait_for_verifications() -> list[dict]:
+    results = []
+    for future in concurrent.futures.as_completed(list(_futures)):
+        try:
+            results.append(future.result())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error("Verification crashed: %s", e)
+    return results
@@ -3,17 +3,25 @@ import os
 import pathlib
 import platform
 import random
-import shutil
 import tempfile
-
-from importlib.metadata import PackageNotFoundError, version
+import time
 
 
 #########################################################################################
 # Logging Configuration
 #########################################################################################
 
-log_file_path = os.path.join(tempfile.gettempdir(), 'aniworld.log')
+LOG_DIRECTORY = os.path.join(tempfile.gettempdir(), "aniworld")
+LOG_FORMAT = "%(asctime)s %(levelname)s:%(threadName)s:%(name)s:%(funcName)s: %(message)s"
+# every run logs to its own file, which is rotated when it grows too large
+LOG_MAX_SIZE = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 2
+# log files of older runs are removed when a new run starts
+LOG_KEEP_RUNS = 10
+
+log_file_path = os.path.join(
+    LOG_DIRECTORY, f"aniworld-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.log"
+)
 
 
 class CriticalErrorHandler(logging.Handler):
@@ -22,34 +30,95 @@ class CriticalErrorHandler(logging.Handler):
             raise SystemExit(record.getMessage())
 
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(levelname)s:%(name)s:%(funcName)s: %(message)s",
-    handlers=[
-        logging.FileHandler(log_file_path, mode='w'),
-        CriticalErrorHandler()
-    ]
-)
+def prune_log_files(keep: int = LOG_KEEP_RUNS) -> None:
+    try:
+        names = os.listdir(LOG_DIRECTORY)
+    except FileNotFoundError:
+        return
+
+    # file names start with the time of the run, rotated files share its prefix
+    runs = sorted({name.split(".log")[0] for name in names if name.startswith("aniworld-")})
+    outdated = set(runs[:-keep] if keep else runs)
+
+    for name in names:
+        if name.split(".log")[0] in outdated:
+            try:
+                os.remove(os.path.join(LOG_DIRECTORY, name))
+            except OSError:
+                pass
+
+
+def setup_logging() -> None:
+    """
+    Configures the root logger for the CLI, importing aniworld as a library
+    leaves logging alone.
+
+    Records are handed to a queue and written to the rotating log file of
+    this run by a background thread, so logging at DEBUG doesn't block the
+    threads that resolve links or download. Warnings are still printed
+    right away and CriticalErrorHandler still exits in the calling thread.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import atexit
+    import queue
+    import logging.handlers
+
+    os.makedirs(LOG_DIRECTORY, exist_ok=True)
+    prune_log_files(LOG_KEEP_RUNS - 1)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file_path,
+        maxBytes=LOG_MAX_SIZE,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
+        # opened on the first record, runs that log nothing don't touch the disk
+        delay=True
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # flushes the records that are still queued when the process exits
+    atexit.register(listener.stop)
+
+    # only merges the arguments into the message, the listener adds the rest
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter(
+        "%(levelname)s:%(name)s:%(funcName)s: %(message)s")
+    )
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.WARNING)
-console_handler.setFormatter(logging.Formatter(
-    "%(levelname)s:%(name)s:%(funcName)s: %(message)s")
-)
-logging.getLogger().addHandler(console_handler)
+    logging.basicConfig(
+        level=logging.WARNING,
+        handlers=[
+            queue_handler,
+            console_handler,
+            CriticalErrorHandler()
+        ]
+    )
 
-logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
-logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
 
 
 #########################################################################################
 # Default Configuration Constants
 #########################################################################################
 
-try:
-    VERSION = version('aniworld')
-except PackageNotFoundError:
-    VERSION = ""
+def get_version() -> str:
+    # importlib.metadata is slow to import, VERSION is resolved on first use
+    # pylint: disable=import-outside-toplevel
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version('aniworld')
+    except PackageNotFoundError:
+        return ""
+
 
 IS_NEWEST_VERSION = True  # For now :)
 PLATFORM_SYSTEM = platform.system()
@@ -67,6 +136,9 @@ PROVIDER_HEADERS = {
 # E.g. Watch, Download, Syncplay
 DEFAULT_ACTION = "Download"
 DEFAULT_ANISKIP = False
+DEFAULT_ANISKIP_PREFETCH_WORKERS = 4
+# seconds playback waits for skip times, later ones are added to the running episode
+DEFAULT_ANISKIP_DEADLINE = 2.0
 DEFAULT_DOWNLOAD_PATH = pathlib.Path.home() / "Downloads"
 DEFAULT_KEEP_WATCHING = False
 # German Dub, English Sub, German Sub
@@ -195,34 +267,121 @@ MPV_SCRIPTS_DIRECTORY = (
     else os.path.expanduser('~/.config/mpv/scripts')
 )
 
-if platform.system() == "Windows":
-    mpv_path = shutil.which("mpv")
-    if not mpv_path:
-        mpv_path = os.path.join(os.getenv('APPDATA', ''),
-                                "aniworld", "mpv", "mpv.exe")
-else:
-    mpv_path = shutil.which("mpv")
 
-MPV_PATH = mpv_path
+def find_tool(name: str) -> str or None:
+    # the tool cache lives in aniworld.common, which itself imports this module
+    # pylint: disable=import-outside-toplevel
+    from aniworld.common import tools
+    return tools.find_tool(name)
+
+
+# Searching PATH and reading package metadata is deferred until a module
+# actually imports one of these, see __getattr__ at the end of this file.
+LAZY_CONSTANTS = {
+    "VERSION": get_version,
+    "MPV_PATH": lambda: find_tool("mpv"),
+    "SYNCPLAY_PATH": lambda: find_tool("syncplay"),
+    "YTDLP_PATH": lambda: find_tool("yt-dlp")
+}
+
+
+#########################################################################################
+# Persistent mpv
+#########################################################################################
+
+# oldest mpv whose JSON IPC takes named loadfile arguments, older ones get one process
+# per episode
+MPV_IPC_MIN_VERSION = (0, 33)
+# seconds mpv gets to create its IPC socket
+MPV_IPC_CONNECT_TIMEOUT = 10
+
+
+#########################################################################################
+# Syncplay Batch
+#########################################################################################
+
+# episodes --keep-watching adds to a batch, their links are resolved before it starts
+SYNCPLAY_BATCH_KEEP_WATCHING = 12
+SYNCPLAY_BATCH_WORKERS = 4
+
 
-if platform.system() == "Windows":
-    syncplay_path = shutil.which("syncplay")
-    if syncplay_path:
-        syncplay_path = syncplay_path.replace(
-            "syncplay.EXE", "SyncplayConsole.exe")
-    else:
-        syncplay_path = os.path.join(
-            os.getenv(
-                'APPDATA', ''), "aniworld", "syncplay", "SyncplayConsole.exe"
-        )
-else:
-    syncplay_path = shutil.which("syncplay")
+#########################################################################################
+# Playback Proxy
+#########################################################################################
+
+# HLS segments downloaded ahead of the one the player is reading
+PROXY_READAHEAD_SEGMENTS = 10
+PROXY_WORKERS = 4
+
+
+#########################################################################################
+# Caches
+#########################################################################################
+
+CACHE_DIRECTORY = os.path.join(DEFAULT_APPDATA_PATH, "cache")
+# mpv chapter files generated from aniskip data
+CHAPTERS_DIRECTORY = os.path.join(CACHE_DIRECTORY, "chapters")
+CHAPTERS_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+CHAPTERS_CACHE_MAX_SIZE = 5 * 1024 * 1024
+# optional anime-offline-database JSON used to map titles to MAL IDs without scraping
+ANIME_DATASET_PATH = os.getenv("ANIWORLD_ANIME_DATASET") or os.path.join(
+    DEFAULT_APPDATA_PATH, "anime-offline-database.json")
+# the full series listing of aniworld.to used for local search
+CATALOGUE_URL = "https://aniworld.to/animes"
+CATALOGUE_TTL = 24 * 60 * 60
+# all series grouped by genre, used by --random
+GENRES_URL = "https://aniworld.to/animes-genres"
+# series, season and episode pages are kept this long in memory, long running
+# processes like the queue worker see newly aired episodes afterwards
+PAGE_CACHE_TTL = 10 * 60
+# direct links resolved ahead of their use, e.g. by --preflight, expire at the
+# provider after a while and are resolved again when they are older than this
+DIRECT_LINK_TTL = 5 * 60
+
+
+#########################################################################################
+# Download Queue
+#########################################################################################
 
-SYNCPLAY_PATH = syncplay_path
+QUEUE_DATABASE_PATH = os.path.join(DEFAULT_APPDATA_PATH, "queue.db")
+DEFAULT_QUEUE_CONCURRENCY = 2
+# seconds the worker sleeps when there is nothing to do
+DEFAULT_QUEUE_POLL_INTERVAL = 5
+# downloads failing verification more often than this stay failed
+DEFAULT_QUEUE_MAX_ATTEMPTS = 3
 
-YTDLP_PATH = shutil.which("yt-dlp")  # already in pip deps
 
 #########################################################################################
+# Download Verification
+#########################################################################################
+
+DEFAULT_VERIFY_WORKERS = 2
+# written next to the downloaded episodes
+MANIFEST_FILE_NAME = ".aniworld-manifest.json"
+# fraction of the playlist duration a download may be shorter
+VERIFY_DURATION_TOLERANCE = 0.02
+
+
+#########################################################################################
+# Disk Space Preflight
+#########################################################################################
+
+# kept free on the output volume on top of the estimated batch size
+DEFAULT_PREFLIGHT_MARGIN = 512 * 1024 * 1024
+DEFAULT_PREFLIGHT_WORKERS = 4
+# preallocated in the output directory while a batch is downloading
+RESERVATION_FILE_NAME = ".aniworld-reserved"
+
+#########################################################################################
+
+
+def __getattr__(name: str):
+    if name in LAZY_CONSTANTS:
+        value = LAZY_CONSTANTS[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
     pass
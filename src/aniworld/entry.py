@@ -1,19 +1,34 @@
-from aniworld.action import watch, syncplay
-from aniworld.models import Anime, Episode
-from aniworld.parser import arguments
-from aniworld.search import search_anime
-from aniworld.execute import execute
-from aniworld.menu import menu
+import sys
+
+# arguments are parsed on import, so --help and --version exit before anything
+# heavy is loaded. The remaining modules are imported where they are needed.
+# pylint: disable=import-outside-toplevel
+from aniworld.config import setup_logging
+
+setup_logging()
+
+from aniworld.parser import arguments  # pylint: disable=wrong-import-position
+from aniworld.settings import Settings, configure  # pylint: disable=wrong-import-position
 
 
 def aniworld() -> None:
+    configure(Settings.from_arguments(arguments))
+
     try:
+        if arguments.queue:
+            from aniworld.jobqueue import handle_queue_command
+            handle_queue_command(arguments)
+            return
         if arguments.local_episodes:
+            from aniworld.action import watch, syncplay
             if arguments.action == "Watch":
-                watch(None)
+                watch(None, arguments.local_episodes)
             elif arguments.action == "Syncplay":
-                syncplay(None)
+                syncplay(None, arguments.local_episodes)
         if arguments.episode:
+            from aniworld.models import Anime, Episode
+            from aniworld.search import search_anime
+            from aniworld.execute import execute
             # TODO: this needs to pass all links to a function
             #       that will return Anime objects instead
             anime_list = []
@@ -31,12 +46,27 @@ def aniworld() -> None:
 
             execute(anime_list=anime_list)
         if not arguments.episode and not arguments.local_episodes:
-            while True:
+            from aniworld.search import search_anime
+            from aniworld.execute import execute
+            from aniworld.menu import menu
+            if arguments.random:
+                import requests
+                from aniworld.catalogue import get_random_slug
+                from aniworld.models import prefetch_series
                 try:
-                    slug = search_anime()
-                    break
-                except ValueError:
-                    continue
+                    slug = get_random_slug(arguments.random)
+                except (ValueError, requests.RequestException) as e:
+                    # unknown genre (the message lists the valid ones) or no connection
+                    print(f"Could not pick a random anime: {e}", file=sys.stderr)
+                    sys.exit(1)
+                prefetch_series(slug)
+            else:
+                while True:
+                    try:
+                        slug = search_anime()
+                        break
+                    except ValueError:
+                        continue
 
             anime = menu(arguments=arguments, slug=slug)
             execute(anime_list=[anime])
@@ -2,6 +2,8 @@ import sys
 
 from aniworld.models import Anime
 from aniworld.action import watch, download, syncplay
+from aniworld.common import emit_summary
+from aniworld.settings import get_settings
 
 
 def execute(anime_list: list[Anime]):
@@ -18,3 +20,6 @@ def execute(anime_list: list[Anime]):
                 raise ValueError("Invalid action specified for anime: {anime}")
         except AttributeError:
             sys.exit()
+
+    if get_settings().progress_events:
+        emit_summary()
@@ -0,0 +1,311 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+import concurrent.futures
+from contextlib import closing
+
+from aniworld.action.download import download_episode, verifies_downloads
+from aniworld.models import Anime, Episode, generate_links, get_season_episode_count
+from aniworld.common import (
+    wait_for_verifications,
+    emit_summary,
+    open_event_stream,
+    get_message_stream
+)
+from aniworld.settings import get_settings
+from aniworld.config import (
+    QUEUE_DATABASE_PATH,
+    DEFAULT_QUEUE_CONCURRENCY,
+    DEFAULT_QUEUE_POLL_INTERVAL,
+    DEFAULT_QUEUE_MAX_ATTEMPTS
+)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+EPISODE_LINK_PATTERN = re.compile(r'/(staffel-\d+/episode-\d+|filme/film-\d+)/?$')
+
+
+def connect(database_path: str = QUEUE_DATABASE_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(database_path), exist_ok=True)
+
+    # autocommit, transactions are opened explicitly where needed
+    connection = sqlite3.connect(
+        database_path, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            link TEXT NOT NULL,
+            language TEXT NOT NULL,
+            provider TEXT NOT NULL,
+            output_dir TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    return connection
+
+
+def add_job(link: str, language: str, provider: str, output_dir: str) -> int:
+    now = time.time()
+    with closing(connect()) as connection:
+        cursor = connection.execute(
+            "INSERT INTO jobs (link, language, provider, output_dir, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (link, language, provider, str(output_dir), now, now)
+        )
+        logging.debug("Queued job %d for %s", cursor.lastrowid, link)
+        return cursor.lastrowid
+
+
+def list_jobs(status: str = None) -> list[sqlite3.Row]:
+    with closing(connect()) as connection:
+        if status:
+            return connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)
+            ).fetchall()
+        return connection.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+
+
+def cancel_job(job_id: int) -> bool:
+    # running jobs are owned by a worker and can't be cancelled from outside
+    with closing(connect()) as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+            (STATUS_CANCELLED, time.time(), job_id, STATUS_PENDING, STATUS_FAILED)
+        )
+        return cursor.rowcount > 0
+
+
+def claim_job() -> sqlite3.Row or None:
+    with closing(connect()) as connection:
+        # BEGIN IMMEDIATE takes the write lock so two workers never claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            job = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1",
+                (STATUS_PENDING,)
+            ).fetchone()
+            if job:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (STATUS_RUNNING, time.time(), job["id"])
+                )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        return job
+
+
+def finish_job(job_id: int, status: str, error: str = None) -> None:
+    with closing(connect()) as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+
+def requeue_job(
+    link: str,
+    language: str,
+    provider: str,
+    output_dir: str,
+    error: str,
+    job_id: int = None
+) -> int:
+    """
+    Puts a download back into the queue after it failed and returns the
+    job ID, or 0 if the job already failed DEFAULT_QUEUE_MAX_ATTEMPTS times.
+    Downloads that didn't run as a job (job_id is None) get a new one.
+    """
+
+    job = None
+    if job_id is not None:
+        with closing(connect()) as connection:
+            job = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    if not job:
+        return add_job(link, language, provider, output_dir)
+
+    if job["attempts"] >= DEFAULT_QUEUE_MAX_ATTEMPTS:
+        finish_job(job["id"], STATUS_FAILED, error)
+        return 0
+
+    finish_job(job["id"], STATUS_PENDING, error)
+    return job["id"]
+
+
+def reset_interrupted_jobs(job_ids: list[int] = None) -> int:
+    # jobs left running by a worker that died are picked up again,
+    # optionally only the given ones
+    query = "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?"
+    parameters = [STATUS_PENDING, time.time(), STATUS_RUNNING]
+    if job_ids is not None:
+        query += f" AND id IN ({', '.join('?' * len(job_ids))})"
+        parameters += job_ids
+
+    with closing(connect()) as connection:
+        return connection.execute(query, parameters).rowcount
+
+
+def expand_job(job: sqlite3.Row) -> int:
+    slug = job["link"].split("/anime/stream/")[-1].split("/")[0]
+    links = generate_links([job["link"]], get_season_episode_count(slug))
+
+    # the episode jobs and the finished parent are committed together, a worker
+    # dying in between would otherwise expand the parent again after a restart
+    now = time.time()
+    with closing(connect()) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO jobs (link, language, provider, output_dir, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (link, job["language"], job["provider"], job["output_dir"], now, now)
+                    for link in links
+                ]
+            )
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (STATUS_DONE, now, job["id"])
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    return len(links)
+
+
+def run_job(job: sqlite3.Row) -> None:
+    if not EPISODE_LINK_PATTERN.search(job["link"]):
+        count = expand_job(job)
+        logging.info("Expanded job %d into %d episodes", job["id"], count)
+        return
+
+    episode = Episode(
+        link=job["link"],
+        _selected_provider=job["provider"],
+        _selected_language=job["language"]
+    )
+    anime = Anime(
+        episode_list=[episode],
+        action="Download",
+        provider=job["provider"],
+        language=job["language"],
+        output_directory=job["output_dir"]
+    )
+
+    if not download_episode(anime, episode, job_id=job["id"]):
+        finish_job(job["id"], STATUS_FAILED, "yt-dlp exited with an error")
+    elif not verifies_downloads():
+        finish_job(job["id"], STATUS_DONE)
+    # a verified job stays running until the verification marks it done or
+    # puts it back into the queue
+
+
+def run_job_safely(job: sqlite3.Row) -> None:
+    try:
+        run_job(job)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.error("Job %d failed: %s", job["id"], e)
+        finish_job(job["id"], STATUS_FAILED, str(e))
+
+
+def worker(
+    concurrency: int = DEFAULT_QUEUE_CONCURRENCY,
+    poll_interval: int = DEFAULT_QUEUE_POLL_INTERVAL
+) -> None:
+    progress_events = get_settings().progress_events
+    if progress_events:
+        # before the first message, which must not end up between the events
+        open_event_stream(progress_events)
+
+    resumed = reset_interrupted_jobs()
+    if resumed:
+        print(f"Resuming {resumed} interrupted job(s).", file=get_message_stream())
+
+    print(
+        f"Queue worker started with {concurrency} slot(s). Press Ctrl+C to stop.",
+        file=get_message_stream()
+    )
+
+    # A single long-lived process keeps the per-series caches in
+    # aniworld.models warm, so many jobs of one show share one crawl.
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            while True:
+                running = {
+                    future: job_id for future, job_id in running.items() if not future.done()
+                }
+
+                job = claim_job() if len(running) < concurrency else None
+                if job:
+                    print(f"[{job['id']}] {job['link']}", file=get_message_stream())
+                    running[executor.submit(run_job_safely, job)] = job["id"]
+                    continue
+
+                time.sleep(poll_interval if not running else 1)
+        except KeyboardInterrupt:
+            print(
+                "Stopping worker, waiting for running downloads...", file=get_message_stream())
+            executor.shutdown(wait=True, cancel_futures=True)
+            wait_for_verifications()
+            emit_summary()
+
+            # Ctrl+C also hits yt-dlp, so jobs that didn't finish are retried next
+            # start, jobs that did finish while shutting down keep their status
+            reset_interrupted_jobs(list(running.values()))
+
+
+def handle_queue_command(arguments) -> None:
+    queue_arguments = arguments.queue
+
+    if queue_arguments.command == "add":
+        for link in queue_arguments.links:
+            job_id = add_job(
+                link,
+                arguments.language,
+                arguments.provider,
+                arguments.output_dir
+            )
+            print(f"Added job {job_id}: {link}")
+    elif queue_arguments.command == "list":
+        jobs = list_jobs(queue_arguments.status)
+        if not jobs:
+            print("The queue is empty.")
+        for job in jobs:
+            print(
+                f"{job['id']:>5}  {job['status']:<9}  {job['provider']:<10}  "
+                f"{job['language']:<11}  {job['link']}"
+                + (f"  ({job['error']})" if job["error"] else "")
+            )
+    elif queue_arguments.command == "cancel":
+        for job_id in queue_arguments.job_id:
+            if cancel_job(job_id):
+                print(f"Cancelled job {job_id}.")
+            else:
+                print(f"Job {job_id} is not pending or does not exist.")
+    elif queue_arguments.command == "worker":
+        worker(concurrency=queue_arguments.concurrency)
+
+
+if __name__ == '__main__':
+    for row in list_jobs():
+        print(dict(row))
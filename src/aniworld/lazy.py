@@ -0,0 +1,30 @@
+import importlib
+
+
+def lazy_exports(namespace: dict, exports: dict):
+    """
+    Returns a module level __getattr__ (PEP 562) that imports the submodule
+    of an export the first time the export is accessed.
+
+    Example:
+        _EXPORTS = {"JsonCache": ".cache", "MpvPlayer": ".mpv"}
+        __getattr__ = lazy_exports(globals(), _EXPORTS)
+
+    All exports of that submodule are bound in the package at once. An
+    export must not be named like a submodule, importing the submodule
+    binds the module under that name and __getattr__ is never asked.
+    """
+
+    package = namespace["__name__"]
+
+    def __getattr__(name: str):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+        module = importlib.import_module(exports[name], package)
+        for export, module_name in exports.items():
+            if module_name == exports[name]:
+                namespace[export] = getattr(module, export)
+        return namespace[name]
+
+    return __getattr__
@@ -1,15 +1,28 @@
 import os
+import re
 import curses
+import logging
+import functools
+import concurrent.futures
+
 import npyscreen
 
-from aniworld.models import Anime, Episode
+from aniworld.models import (
+    Anime,
+    Episode,
+    EpisodeList,
+    get_series_html,
+    get_anime_title_from_html,
+    get_season_count,
+    get_episode_count,
+    get_movie_episode_count
+)
 from aniworld.config import (
     VERSION,
     SUPPORTED_PROVIDERS,
     DEFAULT_PROVIDER_DOWNLOAD,
     DEFAULT_PROVIDER_WATCH,
 )
-from aniworld.parser import USES_DEFAULT_PROVIDER
 
 
 class CustomTheme(npyscreen.ThemeManager):
@@ -36,59 +49,312 @@ class CustomTheme(npyscreen.ThemeManager):
     }
 
 
+LANGUAGES = ["German Dub", "English Sub", "German Sub"]
+# episodes rarely offer more providers than this, the list scrolls otherwise
+PROVIDER_ROWS = 4
+# concurrent requests while the menu fills in seasons, movies and providers
+MENU_FETCH_WORKERS = 4
+LANGUAGE_ABBREVIATIONS = {
+    "German Dub": "DE",
+    "English Sub": "EN-Sub",
+    "German Sub": "DE-Sub"
+}
+
+
+RANGE_ENDPOINT_PATTERN = re.compile(r'^(?:S(\d+)(?:E(\d+))?|M(\d+))$', re.IGNORECASE)
+
+
+def parse_episode_range(text: str, episode_keys: list[tuple]) -> set[int]:
+    """
+    Returns the indices into episode_keys selected by a range expression.
+
+    Example:
+        parse_episode_range("S2E5-S3E12, S5, M1-M2", episode_keys)
+
+    episode_keys are (season, episode) in menu order, movies use season 0
+    and come last. A bare season selects from its first or up to its last
+    episode, "S3E4-" everything from there on. Raises ValueError for
+    anything that isn't a valid range.
+    """
+
+    key_index = {key: index for index, key in enumerate(episode_keys)}
+    season_bounds = {}
+    for index, (season, _) in enumerate(episode_keys):
+        first, _ = season_bounds.get(season, (index, index))
+        season_bounds[season] = (first, index)
+
+    def resolve(endpoint: str, last: bool) -> int:
+        match = RANGE_ENDPOINT_PATTERN.match(endpoint.strip())
+        if not match:
+            raise ValueError(f"Invalid range: {endpoint}")
+
+        season, episode, movie = match.groups()
+        if movie:
+            key = (0, int(movie))
+        elif episode:
+            key = (int(season), int(episode))
+        elif int(season) in season_bounds:
+            return season_bounds[int(season)][1 if last else 0]
+        else:
+            raise ValueError(f"Unknown season: {endpoint}")
+
+        if key not in key_index:
+            raise ValueError(f"Unknown episode: {endpoint}")
+        return key_index[key]
+
+    selected = set()
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        start, dash, end = part.partition("-")
+        first = resolve(start, last=False)
+        if dash and not end.strip():
+            last = len(episode_keys) - 1
+        else:
+            last = resolve(end or start, last=True)
+        selected.update(range(first, last + 1))
+
+    return selected
+
+
 class SelectionMenu(npyscreen.NPSApp):
+    """
+    Episode picker that opens as soon as the series page is loaded.
+
+    Languages and providers (from the first episode), the episode count of
+    every season and the movies are fetched in the background and added to
+    the form as they arrive, the status line shows what is still missing.
+    Until then all languages and supported providers are offered.
+
+    The episode pages of the shown season are prefetched as well, every
+    episode is labeled with its own providers and languages.
+
+    Episodes are identified by (season, episode), movies by (0, movie).
+    The list can be narrowed to one season and a range like "S2E5-S3E12"
+    selects everything in between, so long shows stay manageable.
+    """
+
     def __init__(self, arguments, slug):
         super().__init__()
         self.arguments = arguments
-        self.anime = Anime(slug=slug, episode_list=[
-            Episode(slug=slug, season=1, episode=1)])
+        self.slug = slug
+        self.title = get_anime_title_from_html(get_series_html(slug))
         self.selected_episodes = []
-        self.episode_dict = {}
+        self.episode_keys = []
+        self.selected_keys = set()
+        self.visible_keys = []
+        self.season_filter = None
+        self.season_filters = [None]
+        self.season_episode_count = {}
+        self.movie_episode_count = 0
+        # (season, episode) -> (languages, providers)
+        self.availability = {}
+        self.requested_availability = set()
+        self.executor = None
+        self.pending = {}
+        self.form = None
+        self.status_line = None
         self.action_selection = None
         self.aniskip_selection = None
         self.folder_selection = None
         self.language_selection = None
         self.provider_selection = None
         self.episode_selection = None
+        self.season_selection = None
+        self.range_selection = None
         self.select_all_button = None
 
-    def main(self):
-        available_languages = self.anime[0].language_name
-        season_episode_count = self.anime[0].season_episode_count
-        movie_episode_count = self.anime[0].movie_episode_count
-        available_providers = self.anime[0].provider_name
-
-        supported_providers = [
-            provider for provider in available_providers if provider in SUPPORTED_PROVIDERS]
-
-        for season, episodes in season_episode_count.items():
-            for episode in range(1, episodes + 1):
-                link_formatted = f"{self.anime.title} - Season {season} - Episode {episode}"
-                link = (
-                    f"https://aniworld.to/anime/stream/{self.anime.slug}/"
-                    f"staffel-{season}/episode-{episode}"
-                )
-                self.episode_dict[link] = link_formatted
-
-        for episode in range(1, movie_episode_count + 1):
-            movie_link_formatted = f"{self.anime.title} - Movie {episode}"
-            movie_link = f"https://aniworld.to/anime/stream/{self.anime.slug}/filme/film-{episode}"
-            self.episode_dict[movie_link] = movie_link_formatted
-
-        available_episodes = list(self.episode_dict.values())
+    def start_fetching(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=MENU_FETCH_WORKERS, thread_name_prefix="menu")
+
+        # the episode's own counts are not needed, they are fetched per season below
+        self.requested_availability.add((1, 1))
+        self.pending[self.executor.submit(
+            Episode, slug=self.slug, season=1, episode=1,
+            season_episode_count={}, movie_episode_count=0
+        )] = ("episode", (1, 1))
+        self.pending[self.executor.submit(
+            get_movie_episode_count, self.slug)] = ("movies", None)
+        for season in range(1, get_season_count(self.slug) + 1):
+            self.pending[self.executor.submit(
+                get_episode_count, self.slug, season)] = ("season", season)
+
+    def stop_fetching(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def update_from_background(self):
+        done = [future for future in self.pending if future.done()]
+        if not done:
+            return
+
+        seasons_changed = False
+        for future in done:
+            kind, detail = self.pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.warning("Could not fetch %s %s of %s: %s", kind, detail, self.slug, e)
+                continue
+
+            if kind == "episode":
+                self.set_languages_and_providers(result)
+                self.availability[(1, 1)] = (result.language_name, result.provider_name)
+            elif kind == "availability":
+                self.availability[detail] = (result.language_name, result.provider_name)
+            elif kind == "movies":
+                self.movie_episode_count = result
+                seasons_changed = True
+            else:
+                self.season_episode_count[detail] = result
+                seasons_changed = True
+
+        if seasons_changed:
+            self.update_episodes()
+            self.prefetch_availability()
+        else:
+            self.update_visible_episodes()
+        self.status_line.value = (
+            f"Loading... {len(self.pending)} pages left" if self.pending else ""
+        )
+        self.form.display()
+
+    def set_languages_and_providers(self, episode):
+        selected_language = self.language_selection.get_selected_objects()
+        languages = episode.language_name or LANGUAGES
+        language = selected_language[0] if selected_language else self.arguments.language
+        self.language_selection.values = languages
+        self.language_selection.value = [
+            languages.index(language) if language in languages else 0]
+
+        selected_provider = self.provider_selection.get_selected_objects()
+        providers = [
+            provider for provider in episode.provider_name
+            if provider in SUPPORTED_PROVIDERS
+        ] or SUPPORTED_PROVIDERS
+        provider = selected_provider[0] if selected_provider else self.arguments.provider
+        self.provider_selection.values = providers
+        self.provider_selection.value = [
+            providers.index(provider) if provider in providers else 0]
+
+    def get_link(self, key: tuple) -> str:
+        season, episode = key
+        if season == 0:
+            return f"https://aniworld.to/anime/stream/{self.slug}/filme/film-{episode}"
+        return (
+            f"https://aniworld.to/anime/stream/{self.slug}/"
+            f"staffel-{season}/episode-{episode}"
+        )
 
+    def get_label(self, key: tuple) -> str:
+        season, episode = key
+        if season == 0:
+            label = f"{self.title} - Movie {episode}"
+        else:
+            label = f"{self.title} - Season {season} - Episode {episode}"
+
+        if key in self.availability:
+            languages, providers = self.availability[key]
+            languages = ", ".join(LANGUAGE_ABBREVIATIONS.get(name, name) for name in languages)
+            label += f" [{', '.join(providers)} | {languages}]"
+        return label
+
+    def prefetch_availability(self):
+        """
+        Fetches the episode pages of the shown season (the first one while
+        all seasons are shown) to learn each episode's providers and
+        languages. Requests still queued for another season are dropped.
+        """
+
+        seasons = [season for season in self.season_filters if season]
+        season = self.season_filter if self.season_filter is not None else (
+            seasons[0] if seasons else None)
+
+        for future, (kind, key) in list(self.pending.items()):
+            if kind == "availability" and key[0] != season and future.cancel():
+                del self.pending[future]
+                self.requested_availability.discard(key)
+
+        # movie links can't be turned into Episodes yet
+        if not season or not self.executor:
+            return
+
+        for key in self.episode_keys:
+            if key[0] != season or key in self.availability \
+                    or key in self.requested_availability:
+                continue
+            self.requested_availability.add(key)
+            self.pending[self.executor.submit(
+                Episode, slug=self.slug, link=self.get_link(key),
+                season_episode_count={}, movie_episode_count=0
+            )] = ("availability", key)
+
+    def update_episodes(self):
+        self.episode_keys = [
+            (season, episode)
+            for season in sorted(self.season_episode_count)
+            for episode in range(1, self.season_episode_count[season] + 1)
+        ] + [(0, movie) for movie in range(1, self.movie_episode_count + 1)]
+
+        seasons = sorted(season for season, count in self.season_episode_count.items() if count)
+        filters = [None] + seasons + ([0] if self.movie_episode_count else [])
+        self.season_selection.values = [
+            "All" if season is None else "Movies" if season == 0 else f"Season {season}"
+            for season in filters
+        ]
+        self.season_selection.value = (
+            filters.index(self.season_filter) if self.season_filter in filters else 0)
+        self.season_filters = filters
+
+        self.update_visible_episodes()
+
+    def update_visible_episodes(self):
+        # only the shown season is turned into labels, selection lives in selected_keys
+        self.visible_keys = [
+            key for key in self.episode_keys
+            if self.season_filter is None or key[0] == self.season_filter
+        ]
+        self.episode_selection.values = [self.get_label(key) for key in self.visible_keys]
+        self.episode_selection.value = [
+            index for index, key in enumerate(self.visible_keys) if key in self.selected_keys
+        ]
+        self.episode_selection.display()
+
+    def on_season_filter(self):
+        index = self.season_selection.value
+        if index is None or not 0 <= index < len(self.season_filters):
+            return
+        self.season_filter = self.season_filters[index]
+        self.update_visible_episodes()
+        self.prefetch_availability()
+
+    def on_range(self):
+        text = self.range_selection.value.strip()
+        if not text:
+            return
+        try:
+            indices = parse_episode_range(text, self.episode_keys)
+        except ValueError:
+            # most likely still being typed
+            return
+        self.selected_keys = {self.episode_keys[index] for index in indices}
+        self.update_visible_episodes()
+
+    def main(self):
         terminal_height = os.get_terminal_size().lines
 
         # these are the heights of each widget
         total_reserved_height = (
-            3 + 2 + 2 + 2 + len(available_languages) +
-            len(supported_providers) + 5
+            3 + 2 + 2 + 2 + len(LANGUAGES) +
+            PROVIDER_ROWS + 2 + 5
         )
 
         max_episode_height = max(3, terminal_height - total_reserved_height)
 
         npyscreen.setTheme(CustomTheme)
         f = npyscreen.Form(name=f"Welcome to AniWorld-Downloader {VERSION}")
+        self.form = f
 
         self.action_selection = f.add(
             npyscreen.TitleSelectOne,
@@ -119,37 +385,56 @@ class SelectionMenu(npyscreen.NPSApp):
 
         self.language_selection = f.add(
             npyscreen.TitleSelectOne,
-            max_height=len(available_languages),
+            max_height=len(LANGUAGES),
             value=[
-                available_languages.index(self.arguments.language)
-                if self.arguments.language in available_languages else 0
+                LANGUAGES.index(self.arguments.language)
+                if self.arguments.language in LANGUAGES else 0
             ],
             name="Language",
-            values=available_languages,
+            values=list(LANGUAGES),
             scroll_exit=True,
             rely=self.aniskip_selection.rely + self.aniskip_selection.height
         )
 
         self.provider_selection = f.add(
             npyscreen.TitleSelectOne,
-            max_height=len(supported_providers),
+            max_height=PROVIDER_ROWS,
             value=[
-                supported_providers.index(self.arguments.provider)
-                if self.arguments.provider in supported_providers else 0
+                SUPPORTED_PROVIDERS.index(self.arguments.provider)
+                if self.arguments.provider in SUPPORTED_PROVIDERS else 0
             ],
             name="Provider",
-            values=supported_providers,
+            values=list(SUPPORTED_PROVIDERS),
             scroll_exit=True,
             rely=self.language_selection.rely + self.language_selection.height + 1
         )
 
+        self.season_selection = f.add(
+            npyscreen.TitleCombo,
+            max_height=1,
+            max_width=36,
+            name="Season",
+            values=["All"],
+            value=0,
+            rely=self.provider_selection.rely + self.provider_selection.height + 1
+        )
+
+        self.range_selection = f.add(
+            npyscreen.TitleText,
+            max_height=1,
+            name="Range",
+            begin_entry_at=8,
+            rely=self.season_selection.rely,
+            relx=40
+        )
+
         self.episode_selection = f.add(
             npyscreen.TitleMultiSelect,
             max_height=max_episode_height,
             name="Episode",
-            values=available_episodes,
+            values=[],
             scroll_exit=True,
-            rely=self.provider_selection.rely + self.provider_selection.height + 1
+            rely=self.season_selection.rely + 2
         )
 
         self.select_all_button = f.add(
@@ -158,27 +443,36 @@ class SelectionMenu(npyscreen.NPSApp):
             rely=self.episode_selection.rely + self.episode_selection.height + 1
         )
 
+        self.status_line = f.add(
+            npyscreen.FixedText,
+            value="Loading...",
+            editable=False,
+            color='CAUTION',
+            rely=self.select_all_button.rely,
+            relx=20
+        )
+
         def toggle_select_all():
-            if len(self.episode_selection.value) == len(available_episodes):
-                self.episode_selection.value = []
-                self.selected_episodes = []
+            visible = set(self.visible_keys)
+            if visible <= self.selected_keys:
+                self.selected_keys -= visible
                 self.select_all_button.name = "Select All"
             else:
-                self.episode_selection.value = list(
-                    range(len(available_episodes)))
-                self.selected_episodes = list(self.episode_dict.keys())
+                self.selected_keys |= visible
                 self.select_all_button.name = "Deselect All"
+            self.update_visible_episodes()
             f.display()
 
         self.select_all_button.whenPressed = toggle_select_all
 
         def update_visibility():
             selected_action = self.action_selection.get_selected_objects()[0]
+            supported_providers = self.provider_selection.values
             if selected_action in ["Watch", "Syncplay"]:
                 self.folder_selection.hidden = True
                 self.aniskip_selection.hidden = False
 
-                if USES_DEFAULT_PROVIDER:
+                if self.arguments.uses_default_provider:
                     try:
                         provider_index = supported_providers.index(
                             DEFAULT_PROVIDER_WATCH)
@@ -191,7 +485,7 @@ class SelectionMenu(npyscreen.NPSApp):
                 self.folder_selection.hidden = False
                 self.aniskip_selection.hidden = True
 
-                if USES_DEFAULT_PROVIDER:
+                if self.arguments.uses_default_provider:
                     try:
                         provider_index = supported_providers.index(
                             DEFAULT_PROVIDER_DOWNLOAD)
@@ -207,21 +501,26 @@ class SelectionMenu(npyscreen.NPSApp):
         update_visibility()
 
         self.episode_selection.when_value_edited = self.on_ok
+        self.season_selection.when_value_edited = self.on_season_filter
+        self.range_selection.when_value_edited = self.on_range
 
-        f.edit()
-
-    def on_ok(self):
-        selected_link_formatted = self.episode_selection.get_selected_objects() or []
+        # polls the background fetches every 100 ms while the form waits for keys
+        f.keypress_timeout = 1
+        f.while_waiting = self.update_from_background
+        self.start_fetching()
 
-        # self.selected_episodes = [
-        #    {"link": link, "name": name}
-        #    for link, name in self.episode_dict.items() if name in selected_link_formatted
-        # ]
+        try:
+            f.edit()
+        finally:
+            self.stop_fetching()
 
-        self.selected_episodes = [
-            link
-            for link, name in self.episode_dict.items() if name in selected_link_formatted
-        ]
+    def on_ok(self):
+        # O(visible) per toggle: replace what the shown season contributes
+        self.selected_keys.difference_update(self.visible_keys)
+        self.selected_keys.update(
+            self.visible_keys[index] for index in self.episode_selection.value
+            if index < len(self.visible_keys)
+        )
 
     def get_selected_values(self):
         """
@@ -264,16 +563,32 @@ class SelectionMenu(npyscreen.NPSApp):
         # print(f"Provider: {selected_provider}")
         # print(f"Output Directory: {selected_output_directory}")
 
+        self.selected_episodes = [
+            self.get_link(key) for key in self.episode_keys if key in self.selected_keys
+        ]
+
+        # counts the menu already has don't need to be fetched again per episode
+        loading = {kind for kind, _ in self.pending.values()}
+        season_episode_count = (
+            dict(sorted(self.season_episode_count.items()))
+            if "season" not in loading else None
+        )
+        movie_episode_count = self.movie_episode_count if "movies" not in loading else None
+
         return Anime(
-            title=self.anime.title,
-            episode_list=[
-                Episode(
-                    slug=self.anime.slug,
+            title=self.title,
+            slug=self.slug,
+            episode_list=EpisodeList([
+                functools.partial(
+                    Episode,
+                    slug=self.slug,
                     link=link,
+                    season_episode_count=season_episode_count,
+                    movie_episode_count=movie_episode_count,
                     _selected_language=selected_language,
                     _selected_provider=selected_provider
                 ) for link in self.selected_episodes
-            ],
+            ], workers=MENU_FETCH_WORKERS),
             action=selected_action,
             language=selected_language,
             provider=selected_provider,
@@ -1,6 +1,9 @@
 import re
+import sys
 import json
+import time
 import logging
+import threading
 import concurrent.futures
 
 import requests
@@ -8,8 +11,9 @@ import requests.models
 from bs4 import BeautifulSoup
 
 from aniworld.aniskip import get_mal_id_from_title
-from aniworld.config import DEFAULT_REQUEST_TIMEOUT
-from aniworld.parser import arguments
+from aniworld.common import memoize
+from aniworld.config import DEFAULT_REQUEST_TIMEOUT, DIRECT_LINK_TTL, PAGE_CACHE_TTL
+from aniworld.settings import get_settings
 
 from aniworld.extractors import (
     get_direct_link_from_vidmoly,
@@ -44,6 +48,9 @@ class Anime:
     Required Attributes:
         episode_list (list): A list of Episode objects for the anime.
 
+    Action, provider, language, aniskip and output directory fall back to
+    aniworld.settings.get_settings() when they are not provided.
+
     Attributes:
         title (str): The title of the anime.
         slug (str): A URL-friendly version of the title used for web requests.
@@ -69,11 +76,11 @@ class Anime:
         self,
         title=None,
         slug=None,
-        action=arguments.action,
-        provider=arguments.provider,
-        language=arguments.language,
-        aniskip=arguments.aniskip,
-        output_directory=arguments.output_dir,
+        action=None,
+        provider=None,
+        language=None,
+        aniskip=None,
+        output_directory=None,
         episode_list=None,
         description_german=None,
         # description_english=None,
@@ -86,17 +93,15 @@ class Anime:
         if not self.slug:
             raise ValueError("Slug of Anime is None.")
 
-        self.html = html or requests.get(
-            f"https://aniworld.to/anime/stream/{self.slug}",
-            timeout=DEFAULT_REQUEST_TIMEOUT
-        )
+        self.html = html or get_series_html(self.slug)
 
         self.title = title or get_anime_title_from_html(self.html)
-        self.action = action
-        self.provider = provider
-        self.language = language
-        self.aniskip = aniskip
-        self.output_directory = output_directory
+        settings = get_settings()
+        self.action = action or settings.action
+        self.provider = provider or settings.provider
+        self.language = language or settings.language
+        self.aniskip = settings.aniskip if aniskip is None else aniskip
+        self.output_directory = output_directory or settings.output_directory
         self.episode_list = episode_list
 
         self.description_german = description_german or self._fetch_description_german()
@@ -130,6 +135,14 @@ class Anime:
     def __getitem__(self, index: int):
         return self.episode_list[index]
 
+    def on_episode_ready(self, callback) -> None:
+        # episodes still being built in the background report in as they finish
+        if isinstance(self.episode_list, EpisodeList):
+            self.episode_list.add_done_callback(callback)
+        else:
+            for episode in self.episode_list:
+                callback(episode)
+
     def to_json(self) -> str:
         data = {
             "title": self.title,
@@ -149,6 +162,59 @@ class Anime:
         return self.to_json()
 
 
+class EpisodeList:
+    """
+    A sequence of Episodes that are built concurrently in the background.
+
+    Example:
+        EpisodeList([functools.partial(Episode, link=link) for link in links])
+
+    Iterating yields the episodes in order as soon as each one is ready,
+    so the first episode can be played or downloaded while the others are
+    still fetched. While waiting, a progress line is shown on terminals.
+    """
+
+    def __init__(self, factories: list, workers: int = 4) -> None:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="episode")
+        self._futures = [executor.submit(factory) for factory in factories]
+        # queued episodes still get built, the pool just goes away afterwards
+        executor.shutdown(wait=False)
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        future = self._futures[index]
+        if not future.done() and sys.stdout.isatty():
+            while not future.done():
+                done = sum(future.done() for future in self._futures)
+                print(f"\rLoading episode details {done}/{len(self)}...", end="", flush=True)
+                concurrent.futures.wait([future], timeout=0.2)
+            print("\r\033[K", end="", flush=True)
+
+        return future.result()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def add_done_callback(self, callback) -> None:
+        def on_done(future):
+            if not future.cancelled() and future.exception() is None:
+                callback(future.result())
+
+        for future in self._futures:
+            future.add_done_callback(on_done)
+
+    def __repr__(self) -> str:
+        done = sum(future.done() for future in self._futures)
+        return f"<EpisodeList {done}/{len(self)} ready>"
+
+
 class Episode:
     """
     Represents an episode of an anime series with various attributes
@@ -210,8 +276,8 @@ class Episode:
         has_movies: bool = False,
         movie_episode_count: int = None,
         html: requests.models.Response = None,
-        _selected_provider: str = arguments.provider,
-        _selected_language: str = arguments.language
+        _selected_provider: str = None,
+        _selected_language: str = None
     ) -> None:
         if not link and (not slug or not season or not episode):
             raise ValueError(
@@ -228,6 +294,8 @@ class Episode:
         self.redirect_link = redirect_link
         self.embeded_link = embeded_link
         self.direct_link = direct_link
+        # time.monotonic() when get_direct_link() resolved direct_link
+        self.direct_link_resolved_at: float = None
         self.provider: dict = provider
         self.provider_name: list = provider_name
         self.language: list = language
@@ -236,8 +304,8 @@ class Episode:
         self.has_movies: bool = has_movies
         self.movie_episode_count: int = movie_episode_count
         self.html: requests.models.Response = html
-        self._selected_provider: str = _selected_provider
-        self._selected_language: str = _selected_language
+        self._selected_provider: str = _selected_provider or get_settings().provider
+        self._selected_language: str = _selected_language or get_settings().language
 
         self.auto_fill_details()
 
@@ -345,10 +413,14 @@ class Episode:
                 providers[provider_name][lang_key] = f"https://aniworld.to{redirect_link}"
 
         if not providers:
+            # the page can be hundreds of kilobytes, only decode it for the debug log
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Episode page without providers:\n%s", self.html.text)
             raise ValueError(
-                f"Could not get providers from {self.html.content}")
+                f"Could not get providers from {self.link or self.slug}")
 
-        logging.debug("Final providers dictionary: %s", providers)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Final providers dictionary: %s", providers)
         return providers
 
     def _get_key_from_language(self, language: str) -> int:
@@ -397,54 +469,12 @@ class Episode:
             f"{self._selected_provider} is currently not supported.")
 
     def _get_season_episode_count(self) -> dict:
-        base_url = f"https://aniworld.to/anime/stream/{self.slug}/"
-        response = requests.get(base_url, timeout=15)
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        season_meta = soup.find('meta', itemprop='numberOfSeasons')
-        number_of_seasons = int(season_meta['content']) if season_meta else 0
-
-        episode_counts = {}
-
-        for season in range(1, number_of_seasons + 1):
-            season_url = f"{base_url}staffel-{season}"
-            response = requests.get(season_url, timeout=15)
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            episode_links = soup.find_all('a', href=True)
-            unique_links = set(
-                link['href']
-                for link in episode_links
-                if f"staffel-{season}/episode-" in link['href']
-            )
-
-            episode_counts[season] = len(unique_links)
-
-        return episode_counts
+        return get_season_episode_count(self.slug)
 
     def _get_movie_episode_count(self) -> int:
-        movie_page_url = f"https://aniworld.to/anime/stream/{self.slug}/filme"
-        response = requests.get(
-            movie_page_url, timeout=DEFAULT_REQUEST_TIMEOUT)
-
-        parsed_html = BeautifulSoup(response.content, 'html.parser')
-        movie_indices = []
-
-        movie_index = 1
-        while True:
-            expected_subpath = f"{self.slug}/filme/film-{movie_index}"
-
-            matching_links = [link['href'] for link in parsed_html.find_all(
-                'a', href=True) if expected_subpath in link['href']]
-
-            if matching_links:
-                movie_indices.append(movie_index)
-                movie_index += 1
-            else:
-                break
-
-        self.has_movies = bool(movie_indices)
-        return max(movie_indices) if movie_indices else 0
+        movie_episode_count = get_movie_episode_count(self.slug)
+        self.has_movies = bool(movie_episode_count)
+        return movie_episode_count
 
     def get_redirect_link(self):
         lang_key = self._get_key_from_language(self._selected_language)
@@ -502,8 +532,18 @@ class Episode:
             self.get_embeded_link()
 
         self.direct_link = self._get_direct_link_from_provider()
+        self.direct_link_resolved_at = time.monotonic()
         return self.direct_link
 
+    def has_fresh_direct_link(self, max_age: float = DIRECT_LINK_TTL) -> bool:
+        """
+        Whether direct_link was resolved less than max_age seconds ago and
+        can be used without resolving it again.
+        """
+
+        return (self.direct_link is not None and self.direct_link_resolved_at is not None
+                and time.monotonic() - self.direct_link_resolved_at < max_age)
+
     def auto_fill_details(self) -> None:
         if self.slug and self.season and self.episode:
             self.link = (
@@ -516,21 +556,30 @@ class Episode:
             self.season = self.season or self._get_season_from_link()
             self.episode = self.episode or self._get_episode_from_link()
 
-        self.html = requests.get(self.link, timeout=DEFAULT_REQUEST_TIMEOUT)
+        # values passed by the caller, e.g. shared by all episodes of a series, are kept
+        if self.html is None:
+            self.html = get_episode_html(self.link)
         self.anime_title = get_anime_title_from_html(html=self.html)
         self.title_german, self.title_english = self._get_episode_title_from_html()
         self.language = self._get_available_language_from_html()
         self.language_name = self._get_languages_from_keys(self.language)
         self.provider = self._get_provider_from_html()
         self.provider_name = list(self.provider.keys())
-        self.season_episode_count = self._get_season_episode_count()
-        self.movie_episode_count = self._get_movie_episode_count()
+        if self.season_episode_count is None:
+            self.season_episode_count = self._get_season_episode_count()
+        if self.movie_episode_count is None:
+            self.movie_episode_count = self._get_movie_episode_count()
+        else:
+            self.has_movies = bool(self.movie_episode_count)
 
-        if self.movie_episode_count:
+        if self.movie_episode_count and self.season_episode_count:
             # remove last season as its the same as movies and 0
             last_season = list(self.season_episode_count.keys())[-1]
             if self.season_episode_count[last_season] == 0:
-                del self.season_episode_count[last_season]
+                self.season_episode_count = {
+                    season: count for season, count in self.season_episode_count.items()
+                    if season != last_season
+                }
 
     def to_json(self) -> str:
         data = {
@@ -559,6 +608,136 @@ class Episode:
         return self.to_json()
 
 
+# The series, season and movie pages are the same for every episode of a show.
+# Caching them per process means Episode objects of one series share a single
+# crawl, which also keeps long-running processes like the queue worker warm.
+# Error responses aren't kept and everything expires after PAGE_CACHE_TTL.
+
+
+def is_ok_response(response: requests.models.Response) -> bool:
+    return response.ok
+
+
+@memoize(maxsize=128, ttl=PAGE_CACHE_TTL, cacheable=is_ok_response)
+def get_series_html(slug: str) -> requests.models.Response:
+    return requests.get(
+        f"https://aniworld.to/anime/stream/{slug}",
+        timeout=DEFAULT_REQUEST_TIMEOUT
+    )
+
+
+# the menu prefetches episode pages to show their providers and languages,
+# the Episodes built from the selection afterwards reuse them
+@memoize(maxsize=128, ttl=PAGE_CACHE_TTL, cacheable=is_ok_response)
+def get_episode_html(link: str) -> requests.models.Response:
+    return requests.get(link, timeout=DEFAULT_REQUEST_TIMEOUT)
+
+
+def get_season_count(slug: str) -> int:
+    soup = BeautifulSoup(get_series_html(slug).content, 'html.parser')
+    season_meta = soup.find('meta', itemprop='numberOfSeasons')
+    return int(season_meta['content']) if season_meta else 0
+
+
+@memoize(maxsize=1024, ttl=PAGE_CACHE_TTL)
+def get_episode_count(slug: str, season: int) -> int:
+    season_url = f"https://aniworld.to/anime/stream/{slug}/staffel-{season}"
+    response = requests.get(season_url, timeout=DEFAULT_REQUEST_TIMEOUT)
+    # an error page would be counted, and cached, as a season without episodes
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'html.parser')
+
+    episode_links = soup.find_all('a', href=True)
+    unique_links = set(
+        link['href']
+        for link in episode_links
+        if f"staffel-{season}/episode-" in link['href']
+    )
+
+    return len(unique_links)
+
+
+@memoize(maxsize=128, ttl=PAGE_CACHE_TTL)
+def get_season_episode_count(slug: str) -> dict:
+    return {
+        season: get_episode_count(slug, season)
+        for season in range(1, get_season_count(slug) + 1)
+    }
+
+
+@memoize(maxsize=128, ttl=PAGE_CACHE_TTL)
+def get_movie_episode_count(slug: str) -> int:
+    movie_page_url = f"https://aniworld.to/anime/stream/{slug}/filme"
+    response = requests.get(
+        movie_page_url, timeout=DEFAULT_REQUEST_TIMEOUT)
+    if response.status_code == 404:
+        return 0
+    response.raise_for_status()
+
+    parsed_html = BeautifulSoup(response.content, 'html.parser')
+    movie_indices = []
+
+    movie_index = 1
+    while True:
+        expected_subpath = f"{slug}/filme/film-{movie_index}"
+
+        matching_links = [link['href'] for link in parsed_html.find_all(
+            'a', href=True) if expected_subpath in link['href']]
+
+        if matching_links:
+            movie_indices.append(movie_index)
+            movie_index += 1
+        else:
+            break
+
+    return max(movie_indices) if movie_indices else 0
+
+
+def prefetch_series(slug: str) -> None:
+    # warms the caches above in the background, e.g. while the menu opens
+    def prefetch():
+        try:
+            get_series_html(slug)
+            get_movie_episode_count(slug)
+            get_season_episode_count(slug)
+        except requests.RequestException as e:
+            logging.debug("Prefetching %s failed: %s", slug, e)
+
+    threading.Thread(target=prefetch, name="prefetch", daemon=True).start()
+
+
+def get_next_episode(
+    episode: Episode,
+    provider: str = None,
+    language: str = None
+) -> Episode or None:
+    """
+    Returns the episode following the given one, continuing with the first
+    episode of the next season. None after the last episode and for movies.
+    """
+
+    counts = episode.season_episode_count or {}
+    if episode.season not in counts:
+        return None
+
+    if episode.episode < counts[episode.season]:
+        season, number = episode.season, episode.episode + 1
+    elif counts.get(episode.season + 1):
+        season, number = episode.season + 1, 1
+    else:
+        return None
+
+    return Episode(
+        slug=episode.slug,
+        season=season,
+        episode=number,
+        season_episode_count=counts,
+        movie_episode_count=episode.movie_episode_count,
+        _selected_provider=provider,
+        _selected_language=language
+    )
+
+
 def get_anime_title_from_html(html: requests.models.Response):
     soup = BeautifulSoup(html.content, 'html.parser')
     title_div = soup.find('div', class_='series-title')
@@ -596,7 +775,7 @@ def generate_links(urls, seasons_info):
 
         if "staffel" not in base_url and "episode" not in base_url:
             for season, episodes in seasons_info.items():
-                season_url = f"{base_url}/staffel-{season}/"
+                season_url = f"{base_url}/staffel-{season}"
                 for episode in range(1, episodes + 1):
                     unique_links.add(f"{season_url}/episode-{episode}")
             continue
@@ -2,21 +2,76 @@ import os
 import sys
 import argparse
 import platform
+import shlex
 import logging
 import subprocess
 
-from aniworld.common import download_mpv, download_syncplay
 from aniworld.config import (
+    log_file_path,
     DEFAULT_ACTION,
+    DEFAULT_ANISKIP_DEADLINE,
     DEFAULT_PROVIDER_DOWNLOAD,
     DEFAULT_PROVIDER_WATCH,
     DEFAULT_LANGUAGE,
-    VERSION,
     SUPPORTED_PROVIDERS,
-    DEFAULT_DOWNLOAD_PATH
+    DEFAULT_DOWNLOAD_PATH,
+    DEFAULT_QUEUE_CONCURRENCY
 )
 
-USES_DEFAULT_PROVIDER = False
+
+def parse_queue_arguments(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="aniworld queue",
+        description="Manage the persistent download queue. Action options like "
+                    "--language, --provider or --output-dir apply to added jobs."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser(
+        'add',
+        help='Queue episode, season or series URLs for download.'
+    )
+    add_parser.add_argument(
+        'links',
+        type=str,
+        nargs='+',
+        help='One or more aniworld URLs.'
+    )
+
+    list_parser = subparsers.add_parser(
+        'list',
+        help='Show queued jobs.'
+    )
+    list_parser.add_argument(
+        '--status',
+        type=str,
+        choices=['pending', 'running', 'done', 'failed', 'cancelled'],
+        help='Only show jobs with this status.'
+    )
+
+    cancel_parser = subparsers.add_parser(
+        'cancel',
+        help='Cancel pending or failed jobs.'
+    )
+    cancel_parser.add_argument(
+        'job_id',
+        type=int,
+        nargs='+',
+        help='IDs of the jobs to cancel.'
+    )
+
+    worker_parser = subparsers.add_parser(
+        'worker',
+        help='Run the worker that drains the queue.'
+    )
+    worker_parser.add_argument(
+        '-j', '--concurrency',
+        type=int,
+        default=DEFAULT_QUEUE_CONCURRENCY,
+        help='Number of downloads running at the same time.'
+    )
+
+    return parser.parse_args(argv)
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -107,6 +162,23 @@ def parse_arguments() -> argparse.Namespace:
         type=str,
         help='Set the final download directory (defaults to anime name if not specified).'
     )
+    action_opts.add_argument(
+        '--verify',
+        action='store_true',
+        help='Verify finished downloads and re-queue incomplete ones.'
+    )
+    action_opts.add_argument(
+        '--preflight',
+        type=str,
+        choices=['refuse', 'trim'],
+        help='Check free disk space before a batch and refuse it or trim it to what fits.'
+    )
+    action_opts.add_argument(
+        '--progress-events',
+        type=str,
+        metavar='PATH',
+        help='Write download progress as JSON lines to PATH ("-" for stdout).'
+    )
     action_opts.add_argument(
         '-L', '--language',
         type=str,
@@ -153,6 +225,11 @@ def parse_arguments() -> argparse.Namespace:
         nargs='+',
         help='Set the Syncplay room password.'
     )
+    syncplay_opts.add_argument(
+        '-sB', '--syncplay-batch',
+        action='store_true',
+        help='Play all episodes in one Syncplay session using its shared playlist.'
+    )
 
     # Miscellaneous options
     misc_opts = parser.add_argument_group('Miscellaneous Options')
@@ -161,11 +238,28 @@ def parse_arguments() -> argparse.Namespace:
         action='store_true',
         help='Skip anime intros and outros using Aniskip.'
     )
+    misc_opts.add_argument(
+        '--aniskip-deadline',
+        type=float,
+        default=DEFAULT_ANISKIP_DEADLINE,
+        metavar='SECONDS',
+        help='How long playback waits for skip times, later ones are added while it plays.'
+    )
     misc_opts.add_argument(
         '-K', '--keep-watching',
         action='store_true',
         help='Automatically continue to the next episodes after the selected one.'
     )
+    misc_opts.add_argument(
+        '--proxy',
+        action='store_true',
+        help='Play HLS streams through a local proxy that downloads ahead of the playhead.'
+    )
+    misc_opts.add_argument(
+        '--proxy-persist',
+        action='store_true',
+        help='With --proxy, keep episodes watched to the end in the output directory.'
+    )
     misc_opts.add_argument(
         '-r', '--random',
         type=str,
@@ -184,9 +278,20 @@ def parse_arguments() -> argparse.Namespace:
         help='Output only the execution command.'
     )
 
-    args = parser.parse_args()
+    # "aniworld queue <command>" takes the regular options for the jobs it adds,
+    # everything the main parser does not know belongs to the queue parser
+    if sys.argv[1:2] == ['queue']:
+        if {'-h', '--help'} & set(sys.argv[2:]):
+            parse_queue_arguments(sys.argv[2:])
+        args, queue_argv = parser.parse_known_args(sys.argv[2:])
+        args.queue = parse_queue_arguments(queue_argv)
+    else:
+        args = parser.parse_args()
+        args.queue = None
 
     if args.version:
+        from aniworld.config import VERSION  # pylint: disable=import-outside-toplevel
+
         cowsay = fR"""
 _____________________________
 < AniWorld-Downloader {VERSION} >
@@ -201,6 +306,10 @@ _____________________________
         sys.exit()
 
     # That is written extremly bad
+    if args.update:
+        # pylint: disable=import-outside-toplevel
+        from aniworld.common import download_mpv, download_syncplay
+
     if args.update == "mpv":  # TODO Not checking for the version just reinstalls
         print("Updating MPV...")
         download_mpv(update=True)
@@ -220,10 +329,9 @@ _____________________________
     elif args.update == "anime4k":
         pass  # First implement Anime4k
 
+    # the menu switches to the default of the other action if none was chosen
+    args.uses_default_provider = args.provider is None
     if args.provider is None:
-        # TODO Think about something better
-        global USES_DEFAULT_PROVIDER
-        USES_DEFAULT_PROVIDER = True
         if args.action == "Download":
             args.provider = DEFAULT_PROVIDER_DOWNLOAD
         else:
@@ -259,6 +367,11 @@ _____________________________
         logging.debug("============================================\n")
         logging.debug("Debug mode enabled")
 
+        # the log file is created on the first write of the logging thread,
+        # create it now so the viewers below have something to open
+        with open(log_file_path, 'a', encoding='utf-8'):
+            pass
+
         system = platform.system()
 
         if system == "Darwin":
@@ -266,7 +379,7 @@ _____________________________
                 subprocess.run([
                     "osascript", "-e",
                     'tell application "Terminal" to do script "trap exit SIGINT; '
-                    'tail -f -n +1 $TMPDIR/aniworld.log" activate'
+                    f'tail -F -n +1 {shlex.quote(log_file_path)}" activate'
                 ], check=True)
                 logging.debug(
                     "Started tailing the log file in a new Terminal window.")
@@ -276,7 +389,7 @@ _____________________________
             try:
                 command = (
                     "start cmd /c \"powershell -NoExit -c "
-                    "Get-Content -Wait \"$env:TEMP\\aniworld.log\"\""
+                    f"Get-Content -Wait '{log_file_path}'\""
                 )
                 subprocess.run(command, shell=True, check=True)
                 logging.debug(
@@ -284,9 +397,17 @@ _____________________________
             except subprocess.CalledProcessError as e:
                 logging.error("Failed to start tailing the log file: %s", e)
         elif system == "Linux":
-            open_terminal_with_command('tail -f -n +1 /tmp/aniworld.log')
+            # -F follows the file name across rotations
+            open_terminal_with_command(f'tail -F -n +1 {shlex.quote(log_file_path)}')
 
     return args
 
 
-arguments = parse_arguments()
+def __getattr__(name: str):
+    # sys.argv is parsed when something first asks for the arguments,
+    # importing this module alone has no side effects
+    if name == "arguments":
+        value = parse_arguments()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
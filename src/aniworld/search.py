@@ -1,23 +1,49 @@
+import sys
 import json
+import time
 import html
 import webbrowser
+import concurrent.futures
 from urllib.parse import quote
 
 import curses
 import requests
 
-from aniworld.ascii_art import display_ascii_art
+from aniworld.catalogue import (
+    search_catalogue,
+    refresh_in_background,
+    remember_years,
+    normalize
+)
+
+SEARCH_URL = "https://aniworld.to/ajax/seriesSearch?keyword={}"
+SEARCH_PROMPT = "Search for a series: "
+# seconds without a keystroke before the typed query is searched
+SEARCH_DEBOUNCE = 0.15
+# seconds a query's results are reused while typing
+SEARCH_CACHE_TTL = 60
+
+_search_cache = {}
+_search_executor = None
 
 
 def search_anime(keyword: str = None) -> str:
+    refresh_in_background()
+
+    if not keyword and sys.stdin.isatty() and sys.stdout.isatty():
+        slug = curses.wrapper(interactive_search)
+        if not slug:
+            raise ValueError("Could not get valid anime")
+        return slug
+
+    from aniworld.ascii_art import display_ascii_art  # pylint: disable=import-outside-toplevel
     print(display_ascii_art())
     if not keyword:
-        keyword = input("Search for a series: ").strip()
+        keyword = input(SEARCH_PROMPT).strip()
         if keyword.strip().lower() == "boku no piko":
             raise ValueError("Really? This is not on AniWorld...")
 
-    search_url = f"https://aniworld.to/ajax/seriesSearch?keyword={quote(keyword)}"
-    anime_list = fetch_anime_list(search_url)
+    anime_list = search_series(keyword)
 
     if len(anime_list) == 1:
         return anime_list[0].get("link", None)
@@ -40,8 +66,244 @@ def fetch_anime_list(url: str) -> list:
         raise ValueError("Could not get valid anime: ") from exc
 
 
+def search_series(keyword: str) -> list:
+    anime_list = search_catalogue(keyword)
+    if not anime_list:
+        anime_list = fetch_anime_list(SEARCH_URL.format(quote(keyword)))
+        remember_years(anime_list)
+
+    _search_cache[normalize(keyword)] = (time.monotonic(), anime_list)
+    return anime_list
+
+
+def get_cached_results(keyword: str) -> tuple:
+    """
+    Returns (results, exact) from the results of earlier queries.
+
+    A query nobody searched yet is narrowed down from the longest cached
+    prefix, e.g. "kaguya" from the results of "kag", so the list keeps up
+    with typing while the real search runs. Returns (None, False) if
+    nothing usable is cached.
+    """
+
+    query = normalize(keyword)
+    now = time.monotonic()
+
+    for length in range(len(query), 0, -1):
+        cached = _search_cache.get(query[:length])
+        if not cached or now - cached[0] > SEARCH_CACHE_TTL:
+            continue
+        if length == len(query):
+            return cached[1], True
+        return [
+            anime for anime in cached[1]
+            if query in normalize(anime.get('name', ''))
+            or any(query in normalize(title) for title in anime.get('alternatives', []))
+        ], False
+
+    return None, False
+
+
+class ResultViewport:
+    """
+    Draws the part of a result list that fits below the row `top`.
+
+    Only visible rows are drawn, moving the cursor inside the viewport
+    redraws just the old and the new row, so the cost of a keypress does
+    not depend on the number of results.
+
+    Example:
+        viewport = ResultViewport(stdscr, top=2)
+        viewport.set_results(anime_list)
+        viewport.move(viewport.current_row + 1)
+    """
+
+    def __init__(self, stdscr: curses.window, top: int = 0) -> None:
+        self.stdscr = stdscr
+        self.top = top
+        self.results = []
+        self.current_row = 0
+        self.offset = 0
+
+    @property
+    def rows(self) -> int:
+        return max(self.stdscr.getmaxyx()[0] - self.top, 1)
+
+    def set_results(self, results: list) -> None:
+        self.results = results
+        self.current_row = 0
+        self.offset = 0
+        self.draw()
+
+    def selected(self) -> dict or None:
+        return self.results[self.current_row] if self.results else None
+
+    def draw_row(self, index: int) -> None:
+        width = self.stdscr.getmaxyx()[1]
+        y = self.top + index - self.offset
+        anime = self.results[index]
+        name = anime.get('name', 'No Name')
+        year = anime.get('productionYear') or 'Unknown Year'
+        highlight = curses.A_REVERSE if index == self.current_row else 0
+
+        try:
+            self.stdscr.move(y, 0)
+            self.stdscr.clrtoeol()
+            self.stdscr.addnstr(y, 0, f"{name} ({year})", max(width - 1, 0), highlight)
+        except curses.error:
+            # the terminal shrank since the row was computed, the resize redraws it
+            pass
+
+    def draw(self) -> None:
+        try:
+            self.stdscr.move(self.top, 0)
+            self.stdscr.clrtobot()
+        except curses.error:
+            return
+        for index in range(self.offset, min(self.offset + self.rows, len(self.results))):
+            self.draw_row(index)
+
+    def move(self, row: int, wrap: bool = False) -> None:
+        if not self.results:
+            return
+
+        if wrap:
+            row %= len(self.results)
+        row = min(max(row, 0), len(self.results) - 1)
+        previous_row, self.current_row = self.current_row, row
+
+        if self.offset <= row < self.offset + self.rows:
+            self.draw_row(previous_row)
+            self.draw_row(row)
+            return
+
+        # scroll so the cursor sits at the edge it moved past
+        if row < self.offset:
+            self.offset = row
+        else:
+            self.offset = row - self.rows + 1
+        self.draw()
+
+    def handle_key(self, key) -> bool:
+        """Moves the cursor for navigation keys, returns False for other keys."""
+
+        if key == curses.KEY_DOWN:
+            self.move(self.current_row + 1, wrap=True)
+        elif key == curses.KEY_UP:
+            self.move(self.current_row - 1, wrap=True)
+        elif key == curses.KEY_NPAGE:
+            self.move(self.current_row + self.rows)
+        elif key == curses.KEY_PPAGE:
+            self.move(self.current_row - self.rows)
+        elif key == curses.KEY_HOME:
+            self.move(0)
+        elif key == curses.KEY_END:
+            self.move(len(self.results) - 1)
+        elif key == curses.KEY_RESIZE:
+            self.offset = max(min(self.offset, self.current_row),
+                              self.current_row - self.rows + 1)
+            self.draw()
+        else:
+            return False
+        return True
+
+
+def draw_search_header(stdscr: curses.window, query: str, status: str) -> None:
+    width = stdscr.getmaxyx()[1]
+    try:
+        stdscr.move(1, 0)
+        stdscr.clrtoeol()
+        stdscr.addnstr(1, 0, status, width - 1, curses.A_DIM)
+        stdscr.move(0, 0)
+        stdscr.clrtoeol()
+        stdscr.addnstr(0, 0, SEARCH_PROMPT + query, width - 1)
+        stdscr.move(0, min(len(SEARCH_PROMPT + query), width - 1))
+    except curses.error:
+        pass
+
+
+def interactive_search(stdscr: curses.window) -> str or None:
+    """
+    Curses search that updates its results while typing.
+
+    The query is searched once typing pauses for SEARCH_DEBOUNCE seconds.
+    Requests to aniworld.to run in the background, a result that arrives
+    after the query changed again is dropped. Enter picks the highlighted
+    series, Esc clears the query.
+    """
+
+    global _search_executor  # pylint: disable=global-statement
+
+    if _search_executor is None:
+        _search_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="search")
+
+    stdscr.timeout(int(SEARCH_DEBOUNCE * 1000 / 3))
+    viewport = ResultViewport(stdscr, top=2)
+    query, searched_query, status = "", "", ""
+    shown_header = None
+    last_edit = 0
+    pending = None
+
+    while True:
+        if query.strip() and query != searched_query \
+                and time.monotonic() - last_edit >= SEARCH_DEBOUNCE:
+            searched_query = query
+            cached, exact = get_cached_results(query)
+            if cached is not None:
+                viewport.set_results(cached)
+            if exact:
+                status = f"{len(viewport.results)} results"
+            else:
+                if pending:
+                    pending[1].cancel()
+                pending = (query, _search_executor.submit(search_series, query))
+                status = "Searching..."
+
+        if pending and pending[1].done():
+            pending_query, future = pending
+            pending = None
+            if pending_query == searched_query and not future.cancelled():
+                try:
+                    viewport.set_results(future.result())
+                    status = f"{len(viewport.results)} results"
+                except ValueError:
+                    status = "Search failed, keep typing to retry"
+
+        if shown_header != (query, status):
+            shown_header = (query, status)
+            draw_search_header(stdscr, query, status)
+        else:
+            # the viewport moved the cursor, put it back behind the query
+            stdscr.move(0, min(len(SEARCH_PROMPT + query), stdscr.getmaxyx()[1] - 1))
+        stdscr.refresh()
+
+        try:
+            key = stdscr.get_wch()
+        except curses.error:
+            continue
+
+        if viewport.handle_key(key):
+            if key == curses.KEY_RESIZE:
+                shown_header = None
+        elif key in (curses.KEY_ENTER, "\n", "\r"):
+            if query.strip().lower() == "boku no piko":
+                status = "Really? This is not on AniWorld..."
+            elif viewport.selected():
+                return viewport.selected().get('link')
+        elif key in (curses.KEY_BACKSPACE, "\b", "\x7f"):
+            query, last_edit = query[:-1], time.monotonic()
+        elif key == "\x1b":
+            query, last_edit = "", time.monotonic()
+        elif isinstance(key, str) and key.isprintable():
+            query, last_edit = query + key, time.monotonic()
+
+        if not query.strip() and (searched_query or viewport.results):
+            searched_query, status = query, ""
+            viewport.set_results([])
+
+
 def show_menu(stdscr: curses.window, options: list) -> str:
-    current_row = 0
     konami_code = ['UP', 'UP', 'DOWN', 'DOWN',
                    'LEFT', 'RIGHT', 'LEFT', 'RIGHT', 'b', 'a']
     entered_keys = []
@@ -54,41 +316,30 @@ def show_menu(stdscr: curses.window, options: list) -> str:
         ord('a'): 'a'
     }
 
-    try:
-        while True:
-            stdscr.clear()
-            for idx, anime in enumerate(options):
-                name = anime.get('name', 'No Name')
-                year = anime.get('productionYear', 'Unknown Year')
-                highlight = curses.A_REVERSE if idx == current_row else 0
-                stdscr.attron(highlight)
-                stdscr.addstr(idx, 0, f"{name} ({year})")
-                stdscr.attroff(highlight)
-
-            stdscr.refresh()
-            key = stdscr.getch()
-
-            if key in key_map:
-                entered_keys.append(key_map[key])
-                if len(entered_keys) > len(konami_code):
-                    entered_keys.pop(0)
-                if entered_keys == konami_code:
-                    webbrowser.open(
-                        'https://www.youtube.com/watch?v=PDJLvF1dUek')
-                    entered_keys.clear()
-            else:
+    viewport = ResultViewport(stdscr)
+    viewport.set_results(options)
+
+    while True:
+        stdscr.refresh()
+        key = stdscr.getch()
+
+        if key in key_map:
+            entered_keys.append(key_map[key])
+            if len(entered_keys) > len(konami_code):
+                entered_keys.pop(0)
+            if entered_keys == konami_code:
+                webbrowser.open(
+                    'https://www.youtube.com/watch?v=PDJLvF1dUek')
                 entered_keys.clear()
+        else:
+            entered_keys.clear()
 
-            if key == curses.KEY_DOWN:
-                current_row = (current_row + 1) % len(options)
-            elif key == curses.KEY_UP:
-                current_row = (current_row - 1 + len(options)) % len(options)
-            elif key == ord('\n'):
-                return options[current_row].get('link', 'No Link')
-            elif key == ord('q'):
-                break
-    except curses.error:
-        pass
+        if viewport.handle_key(key):
+            continue
+        if key in (curses.KEY_ENTER, ord('\n')):
+            return viewport.selected().get('link', 'No Link')
+        if key == ord('q'):
+            break
 
     return None
 
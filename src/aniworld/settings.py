@@ -0,0 +1,126 @@
+import argparse
+import dataclasses
+
+from aniworld.config import (
+    DEFAULT_ACTION,
+    DEFAULT_ANISKIP,
+    DEFAULT_ANISKIP_DEADLINE,
+    DEFAULT_DOWNLOAD_PATH,
+    DEFAULT_KEEP_WATCHING,
+    DEFAULT_LANGUAGE,
+    DEFAULT_PROVIDER_DOWNLOAD,
+    DEFAULT_PROVIDER_WATCH
+)
+
+
+@dataclasses.dataclass
+class Settings:
+    """
+    Defaults for Anime and Episode objects that don't get them passed, and
+    the options of the watch, download, syncplay and queue actions.
+
+    Example:
+        from aniworld.settings import Settings, configure
+        from aniworld.models import Anime, Episode
+
+        configure(Settings(action="Watch", language="English Sub"))
+        anime = Anime(episode_list=[Episode(slug="dan-da-dan", season=1, episode=1)])
+
+    Importing aniworld never looks at sys.argv, the CLI configures the
+    settings from its arguments and library users call configure()
+    themselves. Without a provider the default one of the action is used.
+    """
+
+    action: str = DEFAULT_ACTION
+    provider: str or None = None
+    language: str = DEFAULT_LANGUAGE
+    aniskip: bool = DEFAULT_ANISKIP
+    output_directory: str = DEFAULT_DOWNLOAD_PATH
+
+    # print direct links or commands instead of running them
+    only_direct_link: bool = False
+    only_command: bool = False
+    debug: bool = False
+
+    # watch
+    keep_watching: bool = DEFAULT_KEEP_WATCHING
+    aniskip_deadline: float = DEFAULT_ANISKIP_DEADLINE
+    proxy: bool = False
+    proxy_persist: bool = False
+
+    # download
+    verify: bool = False
+    preflight: str or None = None
+    progress_events: str or None = None
+
+    # syncplay
+    syncplay_hostname: str or None = None
+    syncplay_username: str or None = None
+    syncplay_room: str or None = None
+    syncplay_password: str or None = None
+    syncplay_batch: bool = False
+
+    def __post_init__(self) -> None:
+        if self.provider is None:
+            self.provider = get_default_provider(self.action)
+
+    @classmethod
+    def from_arguments(cls, arguments: argparse.Namespace) -> "Settings":
+        return cls(
+            action=arguments.action,
+            provider=arguments.provider,
+            language=arguments.language,
+            aniskip=arguments.aniskip,
+            output_directory=arguments.output_dir,
+            only_direct_link=arguments.only_direct_link,
+            only_command=arguments.only_command,
+            debug=arguments.debug,
+            keep_watching=arguments.keep_watching,
+            aniskip_deadline=arguments.aniskip_deadline,
+            proxy=arguments.proxy,
+            proxy_persist=arguments.proxy_persist,
+            verify=arguments.verify,
+            preflight=arguments.preflight,
+            progress_events=arguments.progress_events,
+            syncplay_hostname=arguments.hostname,
+            syncplay_username=arguments.username,
+            syncplay_room=arguments.room,
+            # the password may be given as several words
+            syncplay_password=" ".join(arguments.password) if arguments.password else None,
+            syncplay_batch=arguments.syncplay_batch
+        )
+
+
+def get_default_provider(action: str) -> str:
+    return DEFAULT_PROVIDER_DOWNLOAD if action == "Download" else DEFAULT_PROVIDER_WATCH
+
+
+_settings = Settings()
+
+
+def get_settings() -> Settings:
+    return _settings
+
+
+def configure(settings: Settings = None, **changes) -> Settings:
+    """
+    Replaces the process wide settings, either with the given object or
+    by changing single fields of the current ones.
+
+    Example:
+        configure(language="German Dub", aniskip=True)
+
+    Changing the action without a provider switches from the default
+    provider of the old action to the one of the new action, a provider
+    that was chosen explicitly is kept.
+    """
+
+    global _settings  # pylint: disable=global-statement
+
+    current = settings or _settings
+    if ("action" in changes and "provider" not in changes
+            and current.provider == get_default_provider(current.action)):
+        changes["provider"] = None
+
+    _settings = dataclasses.replace(current, **changes)
+    return _settings